@@ -110,20 +110,81 @@ WSGI_APPLICATION = 'aabo.wsgi.application'
 # Channels/ASGI désactivé pour compatibilité Render gratuit
 # ASGI_APPLICATION = 'aabo.routage.application'  # À COMMENTER
 
-# CHANNEL_LAYERS = {  # À COMMENTER
-#     'default': {
-#         'BACKEND': 'channels.layers.InMemoryChannelLayer',
-#     }
-# }
+# Couche partagée par tous les processus de la machine (sans Redis)
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'immobilier.couche_canaux.CoucheCanauxSQLite',
+        'CONFIG': {
+            'chemin': DOSSIER_DONNEES / 'canaux.sqlite3',
+        },
+    }
+}
+
+# Long polling de la messagerie : en WSGI, chaque attente immobilise un
+# thread gunicorn jusqu'à 20 s. Capacité réelle = workers × cette valeur,
+# soit 4 attentes simultanées avec le Procfile (2 workers × 2) ; au-delà,
+# les clients reçoivent delai_reessai et interrogent toutes les 3 s.
+# L'augmenter avec --threads, pour garder des threads aux autres requêtes.
+ATTENTES_MESSAGES_PAR_PROCESSUS = int(os.environ.get('ATTENTES_MESSAGES_PAR_PROCESSUS', '2'))
 
 # ============================================
 # BASE DE DONNÉES (SQLite pour gratuit)
 # ============================================
 
+# Appliqués à chaque connexion : WAL pour que les lectures ne bloquent pas
+# l'écriture, attente du verrou plutôt qu'une erreur immédiate, fsync au
+# checkpoint seulement, lecture du fichier par mmap.
+PRAGMAS_SQLITE = ';'.join([
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA mmap_size=134217728',
+])
+
 DATABASES = {
+    # Écritures : BEGIN IMMEDIATE prend le verrou dès l'entrée dans
+    # transaction.atomic(), sans promotion d'une lecture en écriture qui
+    # échouerait sans attendre le busy_timeout. Choix assumé : un atomic()
+    # qui ne fait que lire (admin, lectures gardées sur 'default' par le
+    # routeur) attend lui aussi derrière les écrivains. Les lectures
+    # ordinaires passent par 'lecture', hors transaction, et n'attendent pas.
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': DOSSIER_DONNEES / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': PRAGMAS_SQLITE,
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # Lectures hors transaction (immobilier.base_donnees.RouteurLectureEcriture).
+    'lecture': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': DOSSIER_DONNEES / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': f"{PRAGMAS_SQLITE};PRAGMA query_only=ON",
+        },
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
+}
+
+DATABASE_ROUTERS = ['immobilier.base_donnees.RouteurLectureEcriture']
+
+# ============================================
+# CACHE (partagé entre les workers gunicorn)
+# ============================================
+
+# Fichier SQLite commun aux workers : éviction LRU au-delà de MAX_ENTRIES,
+# incr() atomique pour les clés de version (immobilier.cache_lectures).
+CACHES = {
+    'default': {
+        'BACKEND': 'immobilier.cache_sqlite.CacheSQLite',
+        'LOCATION': DOSSIER_DONNEES / 'cache.sqlite3',
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+            'CULL_FREQUENCY': 4,
+        },
     }
 }
 
@@ -170,8 +231,16 @@ LOGOUT_REDIRECT_URL = '/'
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'  # ESSENTIEL pour collectstatic
 
-# WhiteNoise configuration (pour servir les fichiers)
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# WhiteNoise pour les fichiers statiques ; médias rangés par empreinte de
+# contenu et dédoublonnés (immobilier.stockage).
+STORAGES = {
+    'default': {
+        'BACKEND': 'immobilier.stockage.StockageAdresseContenu',
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
 
 # ============================================
 # 🖼️ FICHIERS MÉDIA (ATTENTION RENDER gratuit)
@@ -180,6 +249,18 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Quotas et reconnaissance du format pendant la réception, empreinte SHA-256
+# calculée au fil de l'écriture du fichier temporaire.
+FILE_UPLOAD_HANDLERS = [
+    'immobilier.controle_televersements.GestionnaireControleTeleversement',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'immobilier.controle_televersements.GestionnaireFichierTemporaire',
+]
+
+# Fragments des téléversements en cours, assemblés sur place puis déplacés
+# dans MEDIA_ROOT : garder les deux sur le même disque.
+DOSSIER_TELEVERSEMENTS = DOSSIER_DONNEES / 'televersements'
+
 # ⚠️ ATTENTION : Les fichiers uploadés dans /media seront PERDUS
 # à chaque redéploiement sur Render (gratuit)
 
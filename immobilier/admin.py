@@ -3,7 +3,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.utils.translation import gettext_lazy as _
 
-from .models import Adresse, Conversation, Message, Publication, Signalement, Utilisateur
+from .models import Adresse, Conversation, EvenementSortant, Message, Publication, ReferenceMedia, ResumeConversation, Signalement, TeleversementFragmente, Utilisateur
 
 
 @admin.register(Utilisateur)
@@ -59,6 +59,34 @@ class AdministrationMessage(admin.ModelAdmin):
     autocomplete_fields = ['conversation', 'expediteur']
 
 
+@admin.register(ResumeConversation)
+class AdministrationResumeConversation(admin.ModelAdmin):
+    list_display = ['conversation', 'utilisateur', 'contact', 'nombre_non_lus', 'date_derniere_activite']
+    search_fields = ['utilisateur__nom_utilisateur', 'contact__nom_utilisateur']
+    readonly_fields = ['conversation', 'utilisateur', 'contact', 'dernier_message', 'date_derniere_activite', 'nombre_non_lus']
+
+
+@admin.register(EvenementSortant)
+class AdministrationEvenementSortant(admin.ModelAdmin):
+    list_display = ['id', 'groupe', 'tentatives', 'prochaine_tentative', 'date_creation']
+    search_fields = ['groupe']
+    readonly_fields = ['groupe', 'donnees', 'tentatives', 'prochaine_tentative', 'jeton', 'date_reservation', 'date_creation']
+
+
+@admin.register(TeleversementFragmente)
+class AdministrationTeleversementFragmente(admin.ModelAdmin):
+    list_display = ['identifiant', 'utilisateur', 'nom_fichier', 'decalage', 'taille', 'date_modification']
+    search_fields = ['nom_fichier', 'utilisateur__nom_utilisateur']
+    readonly_fields = ['identifiant', 'utilisateur', 'nom_fichier', 'taille', 'decalage', 'date_creation', 'date_modification']
+
+
+@admin.register(ReferenceMedia)
+class AdministrationReferenceMedia(admin.ModelAdmin):
+    list_display = ['nom', 'references', 'taille', 'date_creation']
+    search_fields = ['nom']
+    readonly_fields = ['nom', 'references', 'taille', 'date_creation']
+
+
 @admin.register(Signalement)
 class AdministrationSignalement(admin.ModelAdmin):
     list_display = ['id', 'publication', 'auteur', 'motif', 'date_creation']
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ConfigurationImmobilier(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'immobilier'
+
+    def ready(self):
+        from . import signaux  # noqa: F401
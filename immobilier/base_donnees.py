@@ -0,0 +1,75 @@
+import functools
+import logging
+import random
+import sqlite3
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connections
+
+
+journal = logging.getLogger(__name__)
+
+ALIAS_ECRITURE = 'default'
+ALIAS_LECTURE = 'lecture'
+
+TENTATIVES_ECRITURE = 5
+DELAI_INITIAL_REPRISE = 0.05
+DELAI_MAX_REPRISE = 1.0
+
+
+class RouteurLectureEcriture:
+    # Lectures sur des connexions en query_only, écritures sur 'default' dont
+    # les transactions commencent par BEGIN IMMEDIATE (voir DATABASES). Avec
+    # le WAL, les lecteurs ne bloquent jamais l'écrivain.
+
+    def db_for_read(self, model, **hints):
+        if ALIAS_LECTURE not in settings.DATABASES:
+            return None
+        # Dans une transaction, la connexion de lecture ne verrait pas ce qui
+        # vient d'être écrit.
+        if connections[ALIAS_ECRITURE].in_atomic_block:
+            return ALIAS_ECRITURE
+        return ALIAS_LECTURE
+
+    def db_for_write(self, model, **hints):
+        return ALIAS_ECRITURE
+
+    def allow_relation(self, objet1, objet2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == ALIAS_ECRITURE
+
+
+def _base_verrouillee(erreur):
+    # Django enveloppe l'erreur de sqlite3, qui reste dans __cause__. Le code
+    # primaire couvre aussi les variantes étendues (SQLITE_BUSY_SNAPSHOT…).
+    cause = erreur if isinstance(erreur, sqlite3.Error) else erreur.__cause__
+    code = getattr(cause, 'sqlite_errorcode', None)
+    return code is not None and (code & 0xff) in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+
+
+def avec_reprise(fonction):
+    # Pour une fonction dont le corps est une transaction courte : si le
+    # verrou d'écriture n'a pas pu être obtenu dans le busy_timeout, elle est
+    # rejouée après une attente croissante. BEGIN IMMEDIATE échoue avant
+    # toute écriture, rejouer la fonction entière est donc sans effet de bord.
+    # Imbriquée dans une transaction, l'erreur remonte telle quelle.
+    @functools.wraps(fonction)
+    def enveloppe(*arguments, **options):
+        delai = DELAI_INITIAL_REPRISE
+        for tentative in range(1, TENTATIVES_ECRITURE + 1):
+            try:
+                return fonction(*arguments, **options)
+            except OperationalError as erreur:
+                if (
+                    tentative == TENTATIVES_ECRITURE
+                    or not _base_verrouillee(erreur)
+                    or connections[ALIAS_ECRITURE].in_atomic_block
+                ):
+                    raise
+                journal.warning("Base verrouillée pendant %s, nouvel essai (%s)", fonction.__name__, tentative)
+            time.sleep(delai * random.uniform(0.5, 1.5))
+            delai = min(delai * 2, DELAI_MAX_REPRISE)
+    return enveloppe
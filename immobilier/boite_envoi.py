@@ -0,0 +1,124 @@
+import logging
+import threading
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import EvenementSortant
+
+
+journal = logging.getLogger(__name__)
+
+TAILLE_LOT = 100
+TENTATIVES_MAX = 8
+DUREE_RESERVATION = timedelta(seconds=60)
+INTERVALLE_REPARTITEUR = 5
+
+
+def enregistrer_evenements(evenements):
+    # À appeler dans la transaction qui produit l'événement : il n'existe que
+    # si l'écriture est validée, et le répartiteur n'est réveillé qu'après.
+    EvenementSortant.objects.bulk_create(
+        [EvenementSortant(groupe=groupe, donnees=donnees) for groupe, donnees in evenements]
+    )
+    transaction.on_commit(reveiller_repartiteur)
+
+
+def _delai_avant_nouvel_essai(tentatives):
+    return timedelta(seconds=min(2 ** tentatives, 300))
+
+
+def reserver_lot(taille=TAILLE_LOT):
+    maintenant = timezone.now()
+    jeton = uuid.uuid4().hex
+    disponibles = (
+        EvenementSortant.objects
+        .filter(prochaine_tentative__lte=maintenant)
+        .exclude(jeton__gt='', date_reservation__gt=maintenant - DUREE_RESERVATION)
+        .order_by('prochaine_tentative', 'id')
+        .values('id')[:taille]
+    )
+    # La mise à jour conditionnelle garantit qu'un seul processus obtient
+    # chaque événement, même si plusieurs répartiteurs tournent en parallèle.
+    reserves = EvenementSortant.objects.filter(id__in=disponibles).update(jeton=jeton, date_reservation=maintenant)
+    if not reserves:
+        return []
+    return list(EvenementSortant.objects.filter(jeton=jeton).order_by('id'))
+
+
+def distribuer_lot(taille=TAILLE_LOT):
+    evenements = reserver_lot(taille)
+    if not evenements:
+        return 0
+
+    canal = get_channel_layer()
+    envoyes = []
+    echecs = []
+    for evenement in evenements:
+        if canal is None:
+            envoyes.append(evenement.id)
+            continue
+        try:
+            async_to_sync(canal.group_send)(evenement.groupe, evenement.donnees)
+        except Exception:
+            journal.exception("Diffusion impossible vers %s", evenement.groupe)
+            echecs.append(evenement)
+        else:
+            envoyes.append(evenement.id)
+
+    maintenant = timezone.now()
+    abandonnes = [evenement.id for evenement in echecs if evenement.tentatives + 1 >= TENTATIVES_MAX]
+    EvenementSortant.objects.filter(id__in=envoyes + abandonnes).delete()
+    for evenement in echecs:
+        if evenement.id in abandonnes:
+            continue
+        EvenementSortant.objects.filter(id=evenement.id).update(
+            tentatives=evenement.tentatives + 1,
+            prochaine_tentative=maintenant + _delai_avant_nouvel_essai(evenement.tentatives + 1),
+            jeton='',
+            date_reservation=None,
+        )
+
+    return len(evenements)
+
+
+def distribuer_tout():
+    total = 0
+    while True:
+        nombre = distribuer_lot()
+        total += nombre
+        if nombre < TAILLE_LOT:
+            return total
+
+
+class Repartiteur(threading.Thread):
+    def __init__(self):
+        super().__init__(name='repartiteur_evenements', daemon=True)
+        self.reveil = threading.Event()
+
+    def run(self):
+        while True:
+            self.reveil.wait(INTERVALLE_REPARTITEUR)
+            self.reveil.clear()
+            close_old_connections()
+            try:
+                distribuer_tout()
+            except Exception:
+                journal.exception("Échec du répartiteur d'événements")
+
+
+_repartiteur = None
+_verrou_repartiteur = threading.Lock()
+
+
+def reveiller_repartiteur():
+    global _repartiteur
+    with _verrou_repartiteur:
+        if _repartiteur is None or not _repartiteur.is_alive():
+            _repartiteur = Repartiteur()
+            _repartiteur.start()
+    _repartiteur.reveil.set()
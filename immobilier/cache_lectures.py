@@ -0,0 +1,91 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Adresse, Publication, Utilisateur
+
+
+DUREE_CACHE_LECTURES = 60 * 60
+
+ESPACE_PUBLICATION = 'publication:{}'
+ESPACE_PROFIL = 'profil:{}'
+ESPACE_LIEUX = 'lieux'
+
+CLE_VERSION = 'version:{}'
+CLE_DETAILS_PUBLICATION = 'publication_details:{}'
+CLE_PROFIL_UTILISATEUR = 'profil_utilisateur:{}'
+CLE_LIEUX = 'lieux_connus'
+
+
+def _version(espace):
+    # Les entrées d'un espace sont lues sous sa version courante : l'invalider
+    # revient à incrémenter la version, les anciennes entrées ne sont plus
+    # jamais lues et partent avec l'éviction LRU. Une clé de version évincée
+    # repart de l'heure en nanosecondes, jamais d'une valeur déjà servie.
+    return cache.get_or_set(CLE_VERSION.format(espace), time.time_ns, None)
+
+
+def invalider(*espaces):
+    def incrementer():
+        for espace in espaces:
+            try:
+                cache.incr(CLE_VERSION.format(espace))
+            except ValueError:
+                pass
+    transaction.on_commit(incrementer)
+
+
+def _lire_ou_calculer(cle, espace, calculer):
+    version = _version(espace)
+    valeur = cache.get(cle, version=version)
+    if valeur is None:
+        valeur = calculer()
+        if valeur is not None:
+            cache.set(cle, valeur, DUREE_CACHE_LECTURES, version=version)
+    return valeur
+
+
+def publication_details(identifiant):
+    return _lire_ou_calculer(
+        CLE_DETAILS_PUBLICATION.format(identifiant),
+        ESPACE_PUBLICATION.format(identifiant),
+        lambda: Publication.objects.select_related('proprietaire', 'adresse').defer('proprietaire__password').filter(pk=identifiant).first(),
+    )
+
+
+def profil_utilisateur(nom_utilisateur):
+    # (utilisateur, publications) ou None.
+    def calculer():
+        utilisateur = Utilisateur.objects.defer('password').filter(nom_utilisateur=nom_utilisateur).first()
+        if utilisateur is None:
+            return None
+        publications = Publication.objects.filter(proprietaire=utilisateur).select_related('adresse').order_by('-date_creation')
+        return utilisateur, list(publications)
+
+    return _lire_ou_calculer(CLE_PROFIL_UTILISATEUR.format(nom_utilisateur), ESPACE_PROFIL.format(nom_utilisateur), calculer)
+
+
+def lieux_connus():
+    # Communes et quartiers déjà saisis, proposés dans les formulaires.
+    def calculer():
+        paires = Adresse.objects.order_by('commune', 'quartier').values_list('commune', 'quartier').distinct()
+        communes = set()
+        quartiers = set()
+        for commune, quartier in paires:
+            communes.add(commune)
+            quartiers.add(quartier)
+        return {'communes': sorted(communes, key=str.casefold), 'quartiers': sorted(quartiers, key=str.casefold)}
+
+    return _lire_ou_calculer(CLE_LIEUX, ESPACE_LIEUX, calculer)
+
+
+def invalider_publications(publications):
+    # `publications` : paires (identifiant, nom_utilisateur du propriétaire).
+    espaces = set()
+    for identifiant, nom_utilisateur in publications:
+        espaces.add(ESPACE_PUBLICATION.format(identifiant))
+        if nom_utilisateur:
+            espaces.add(ESPACE_PROFIL.format(nom_utilisateur))
+    if espaces:
+        invalider(*espaces)
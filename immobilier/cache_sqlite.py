@@ -0,0 +1,209 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+SQL_CREATION = [
+    """
+    CREATE TABLE IF NOT EXISTS entrees (
+        cle TEXT PRIMARY KEY,
+        valeur BLOB NOT NULL,
+        expiration REAL,
+        acces REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS entrees_expiration_idx ON entrees (expiration) WHERE expiration IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS entrees_acces_idx ON entrees (acces)",
+]
+
+# La date du dernier accès n'est réécrite qu'au-delà de cet écart : une
+# lecture ne devient pas une écriture à chaque fois, l'ordre LRU reste
+# exact à la minute près.
+RESOLUTION_ACCES = 60
+# Élagage (entrées expirées, puis les moins récemment lues au-delà de
+# MAX_ENTRIES) toutes les N écritures d'un même processus.
+INTERVALLE_ELAGAGE = 100
+
+
+class CacheSQLite(BaseCache):
+    # Cache partagé par tous les workers d'une machine, dans un fichier SQLite
+    # en WAL comme la couche de canaux : les lectures ne bloquent pas les
+    # écritures. TTL à l'expiration, éviction LRU au-delà de MAX_ENTRIES,
+    # incr() atomique entre processus pour les clés de version.
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.chemin = str(location)
+        self._local = threading.local()
+        # Les connexions sont propres à chaque thread, ce compteur non.
+        self._ecritures = 0
+        self._verrou_ecritures = threading.Lock()
+
+    def _base(self):
+        # Une connexion par thread, recréée après un fork.
+        connexion = getattr(self._local, 'connexion', None)
+        if connexion is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.chemin) or '.', exist_ok=True)
+            connexion = sqlite3.connect(self.chemin, timeout=5, isolation_level=None)
+            connexion.execute('PRAGMA journal_mode=WAL')
+            connexion.execute('PRAGMA synchronous=NORMAL')
+            for sql in SQL_CREATION:
+                connexion.execute(sql)
+            self._local.connexion = connexion
+            self._local.pid = os.getpid()
+        return connexion
+
+    def _ecrire(self, sql, parametres):
+        curseur = self._base().execute(sql, parametres)
+        self._apres_ecriture()
+        return curseur.rowcount
+
+    def _apres_ecriture(self):
+        with self._verrou_ecritures:
+            self._ecritures += 1
+            elaguer = self._ecritures % INTERVALLE_ELAGAGE == 0
+        if elaguer:
+            self._elaguer()
+
+    def _elaguer(self):
+        base = self._base()
+        base.execute('DELETE FROM entrees WHERE expiration <= ?', (time.time(),))
+        (nombre,) = base.execute('SELECT COUNT(*) FROM entrees').fetchone()
+        if nombre <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            base.execute('DELETE FROM entrees')
+            return
+        base.execute(
+            'DELETE FROM entrees WHERE cle IN (SELECT cle FROM entrees ORDER BY acces LIMIT ?)',
+            (nombre // self._cull_frequency,),
+        )
+
+    def _lire(self, cles):
+        base = self._base()
+        maintenant = time.time()
+        marques = ','.join('?' * len(cles))
+        lignes = base.execute(
+            f'SELECT cle, valeur, expiration, acces FROM entrees WHERE cle IN ({marques})', cles
+        ).fetchall()
+        valeurs = {}
+        anciennes = []
+        for cle, valeur, expiration, acces in lignes:
+            if expiration is not None and expiration <= maintenant:
+                continue
+            valeurs[cle] = pickle.loads(valeur)
+            if acces < maintenant - RESOLUTION_ACCES:
+                anciennes.append(cle)
+        if anciennes:
+            marques = ','.join('?' * len(anciennes))
+            base.execute(f'UPDATE entrees SET acces = ? WHERE cle IN ({marques})', [maintenant, *anciennes])
+        return valeurs
+
+    def get(self, key, default=None, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        return self._lire([cle]).get(cle, default)
+
+    def get_many(self, keys, version=None):
+        cles = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not cles:
+            return {}
+        return {cles[cle]: valeur for cle, valeur in self._lire(list(cles)).items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        self._ecrire(
+            'INSERT OR REPLACE INTO entrees (cle, valeur, expiration, acces) VALUES (?, ?, ?, ?)',
+            (cle, pickle.dumps(value, self.pickle_protocol), self.get_backend_timeout(timeout), time.time()),
+        )
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expiration = self.get_backend_timeout(timeout)
+        maintenant = time.time()
+        base = self._base()
+        base.execute('BEGIN IMMEDIATE')
+        try:
+            base.executemany(
+                'INSERT OR REPLACE INTO entrees (cle, valeur, expiration, acces) VALUES (?, ?, ?, ?)',
+                [
+                    (self.make_and_validate_key(key, version=version), pickle.dumps(value, self.pickle_protocol), expiration, maintenant)
+                    for key, value in data.items()
+                ],
+            )
+            base.execute('COMMIT')
+        except BaseException:
+            base.execute('ROLLBACK')
+            raise
+        self._apres_ecriture()
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        maintenant = time.time()
+        # N'écrase qu'une entrée expirée.
+        return bool(self._ecrire(
+            """
+            INSERT INTO entrees (cle, valeur, expiration, acces) VALUES (?, ?, ?, ?)
+            ON CONFLICT (cle) DO UPDATE SET valeur = excluded.valeur, expiration = excluded.expiration, acces = excluded.acces
+            WHERE entrees.expiration IS NOT NULL AND entrees.expiration <= ?
+            """,
+            (cle, pickle.dumps(value, self.pickle_protocol), self.get_backend_timeout(timeout), maintenant, maintenant),
+        ))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        return bool(self._ecrire(
+            'UPDATE entrees SET expiration = ? WHERE cle = ? AND (expiration IS NULL OR expiration > ?)',
+            (self.get_backend_timeout(timeout), cle, time.time()),
+        ))
+
+    def incr(self, key, delta=1, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        base = self._base()
+        base.execute('BEGIN IMMEDIATE')
+        try:
+            ligne = base.execute(
+                'SELECT valeur FROM entrees WHERE cle = ? AND (expiration IS NULL OR expiration > ?)',
+                (cle, time.time()),
+            ).fetchone()
+            if ligne is None:
+                raise ValueError(f"Key '{key}' not found")
+            valeur = pickle.loads(ligne[0]) + delta
+            base.execute(
+                'UPDATE entrees SET valeur = ?, acces = ? WHERE cle = ?',
+                (pickle.dumps(valeur, self.pickle_protocol), time.time(), cle),
+            )
+            base.execute('COMMIT')
+        except BaseException:
+            base.execute('ROLLBACK')
+            raise
+        return valeur
+
+    def delete(self, key, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        return bool(self._ecrire('DELETE FROM entrees WHERE cle = ?', (cle,)))
+
+    def delete_many(self, keys, version=None):
+        cles = [self.make_and_validate_key(key, version=version) for key in keys]
+        if cles:
+            marques = ','.join('?' * len(cles))
+            self._ecrire(f'DELETE FROM entrees WHERE cle IN ({marques})', cles)
+
+    def has_key(self, key, version=None):
+        cle = self.make_and_validate_key(key, version=version)
+        return self._base().execute(
+            'SELECT 1 FROM entrees WHERE cle = ? AND (expiration IS NULL OR expiration > ?)',
+            (cle, time.time()),
+        ).fetchone() is not None
+
+    def clear(self):
+        self._base().execute('DELETE FROM entrees')
+
+    def close(self, **kwargs):
+        # Connexions conservées d'une requête à l'autre, comme CONN_MAX_AGE.
+        pass
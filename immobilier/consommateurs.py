@@ -1,17 +1,113 @@
+import asyncio
+
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.db import database_sync_to_async
 
-from django.db import models
+from django.core.exceptions import ValidationError
+
+from .formulaires import FormulaireMessage
+from .models import Conversation, ResumeConversation
+from .participants import est_participant
+from .serialisation import serialiser_message, serialiser_resume
+from .services import enregistrer_message, marquer_conversation_lue, total_non_lus
+
+
+DELAI_REGROUPEMENT_ACQUITTEMENTS = 0.5
+
+
+def _envoyer_message(utilisateur, identifiant_conversation, contenu):
+    if not est_participant(identifiant_conversation, utilisateur.id):
+        return None, 'Interdit.'
+    conversation = Conversation.objects.filter(pk=identifiant_conversation).first()
+    if conversation is None:
+        return None, 'Interdit.'
+
+    formulaire = FormulaireMessage({'contenu': contenu})
+    if not formulaire.is_valid():
+        return None, 'Message invalide.'
+
+    message = formulaire.save(commit=False)
+    message.conversation = conversation
+    message.expediteur = utilisateur
+    try:
+        message.full_clean()
+    except ValidationError:
+        return None, 'Message invalide.'
+    enregistrer_message(message)
+    return serialiser_message(message, utilisateur.id, conversation), None
+
+
+def _marquer_lus(utilisateur, acquittements):
+    identifiants = [identifiant for identifiant in acquittements if est_participant(identifiant, utilisateur.id)]
+    for conversation in Conversation.objects.filter(pk__in=identifiants):
+        marquer_conversation_lue(conversation, utilisateur, jusqu_a=acquittements[conversation.id])
+
+
+class ReceptionClient:
+    # Trames acceptées du client : {"type": "envoyer", "conversation", "contenu",
+    # "ref"} et {"type": "lu", "conversation", "jusqu_a"}. Les accusés de
+    # lecture d'une même rafale sont regroupés en une seule écriture.
+
+    conversation_par_defaut = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._acquittements = {}
+        self._tache_acquittements = None
+
+    async def receive_json(self, contenu, **kwargs):
+        if not isinstance(contenu, dict):
+            return
+
+        # type() et non isinstance() : True et False sont des int.
+        identifiant_conversation = contenu.get('conversation') or self.conversation_par_defaut
+        if type(identifiant_conversation) is not int:
+            await self.send_json({'type': 'erreur', 'ref': contenu.get('ref'), 'detail': 'Conversation invalide.'})
+            return
+
+        if contenu.get('type') == 'envoyer':
+            texte = contenu.get('contenu')
+            message, erreur = await database_sync_to_async(_envoyer_message)(
+                self.scope['user'],
+                identifiant_conversation,
+                texte if isinstance(texte, str) else '',
+            )
+            if erreur:
+                await self.send_json({'type': 'erreur', 'ref': contenu.get('ref'), 'detail': erreur})
+            else:
+                await self.send_json({'type': 'envoye', 'ref': contenu.get('ref'), 'conversation': identifiant_conversation, 'message': message})
+
+        elif contenu.get('type') == 'lu':
+            jusqu_a = contenu.get('jusqu_a')
+            if type(jusqu_a) is not int or jusqu_a <= 0:
+                await self.send_json({'type': 'erreur', 'ref': contenu.get('ref'), 'detail': 'Accusé de lecture invalide.'})
+                return
+            self._acquitter(identifiant_conversation, jusqu_a)
+
+    def _acquitter(self, identifiant_conversation, jusqu_a):
+        self._acquittements[identifiant_conversation] = max(self._acquittements.get(identifiant_conversation, 0), jusqu_a)
+        if self._tache_acquittements is None:
+            self._tache_acquittements = asyncio.ensure_future(self._vider_acquittements(DELAI_REGROUPEMENT_ACQUITTEMENTS))
 
-from .models import Conversation
+    async def _vider_acquittements(self, delai=0):
+        if delai:
+            await asyncio.sleep(delai)
+        acquittements = self._acquittements
+        self._acquittements = {}
+        self._tache_acquittements = None
+        if acquittements:
+            await database_sync_to_async(_marquer_lus)(self.scope['user'], acquittements)
 
+    async def _terminer_acquittements(self):
+        if self._tache_acquittements is not None:
+            self._tache_acquittements.cancel()
+        await self._vider_acquittements()
 
-class ConsommateurConversation(AsyncJsonWebsocketConsumer):
+
+class ConsommateurConversation(ReceptionClient, AsyncJsonWebsocketConsumer):
     @database_sync_to_async
     def _utilisateur_a_acces(self, identifiant_conversation, utilisateur_id):
-        return Conversation.objects.filter(pk=identifiant_conversation).filter(
-            models.Q(proprietaire_id=utilisateur_id) | models.Q(demandeur_id=utilisateur_id)
-        ).exists()
+        return est_participant(identifiant_conversation, utilisateur_id)
 
     async def connect(self):
         utilisateur = self.scope.get('user')
@@ -35,13 +131,69 @@ class ConsommateurConversation(AsyncJsonWebsocketConsumer):
             await self.close(code=4403)
             return
 
+        self.conversation_par_defaut = identifiant
         self.groupe_conversation = f"conversation_{identifiant}"
         await self.channel_layer.group_add(self.groupe_conversation, self.channel_name)
         await self.accept()
 
     async def disconnect(self, code):
+        await self._terminer_acquittements()
         if hasattr(self, 'groupe_conversation'):
             await self.channel_layer.group_discard(self.groupe_conversation, self.channel_name)
 
     async def message_nouveau(self, evenement):
-        await self.send_json({'type': 'message', 'message': evenement.get('message')})
+        message = dict(evenement.get('message') or {})
+        message['est_moi'] = message.get('expediteur_id') == self.scope['user'].id
+        await self.send_json({'type': 'message', 'message': message})
+
+
+class ConsommateurUtilisateur(ReceptionClient, AsyncJsonWebsocketConsumer):
+    @database_sync_to_async
+    def _total_non_lus(self):
+        return total_non_lus(self.utilisateur_id)
+
+    @database_sync_to_async
+    def _resume_conversation(self, identifiant_conversation):
+        resume = (
+            ResumeConversation.objects
+            .filter(conversation_id=identifiant_conversation, utilisateur_id=self.utilisateur_id)
+            .select_related('conversation__publication', 'contact', 'dernier_message')
+            .first()
+        )
+        return serialiser_resume(resume) if resume else None
+
+    async def connect(self):
+        utilisateur = self.scope.get('user')
+        if not utilisateur or not utilisateur.is_authenticated:
+            await self.close(code=4401)
+            return
+
+        self.utilisateur_id = utilisateur.id
+        self.groupe_utilisateur = f"utilisateur_{utilisateur.id}"
+        await self.channel_layer.group_add(self.groupe_utilisateur, self.channel_name)
+        await self.accept()
+
+        self.dernier_total_non_lus = await self._total_non_lus()
+        await self.send_json({'type': 'non_lus', 'total': self.dernier_total_non_lus})
+
+    async def disconnect(self, code):
+        await self._terminer_acquittements()
+        if hasattr(self, 'groupe_utilisateur'):
+            await self.channel_layer.group_discard(self.groupe_utilisateur, self.channel_name)
+
+    async def conversation_activite(self, evenement):
+        identifiant_conversation = evenement.get('conversation_id')
+
+        message = evenement.get('message')
+        if message:
+            message = dict(message, est_moi=message.get('expediteur_id') == self.utilisateur_id)
+            await self.send_json({'type': 'message', 'conversation': identifiant_conversation, 'message': message})
+
+        resume = await self._resume_conversation(identifiant_conversation)
+        if resume:
+            await self.send_json({'type': 'conversation', 'conversation': resume})
+
+        total = await self._total_non_lus()
+        if total != self.dernier_total_non_lus:
+            self.dernier_total_non_lus = total
+            await self.send_json({'type': 'non_lus', 'total': total})
@@ -0,0 +1,125 @@
+import hashlib
+import logging
+
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload, TemporaryFileUploadHandler
+
+
+journal = logging.getLogger(__name__)
+
+Mo = 1024 * 1024
+
+# Taille maximale par champ de fichier, vérifiée pendant la réception.
+QUOTAS_TELEVERSEMENT = {
+    'video': 500 * Mo,
+    'fichier': 25 * Mo,
+    'vocal': 10 * Mo,
+    'photo': 15 * Mo,
+}
+QUOTA_PAR_DEFAUT = 25 * Mo
+
+# Marge laissée aux autres champs du formulaire quand on compare la taille
+# annoncée de la requête entière au quota d'un fichier.
+MARGE_CHAMPS = 1 * Mo
+
+
+def _mp4(entete):
+    return entete[4:8] == b'ftyp'
+
+
+def _webm(entete):
+    return entete.startswith(b'\x1a\x45\xdf\xa3')
+
+
+def _ogg(entete):
+    return entete.startswith(b'OggS')
+
+
+def _jpeg(entete):
+    return entete.startswith(b'\xff\xd8\xff')
+
+
+def _png(entete):
+    return entete.startswith(b'\x89PNG\r\n\x1a\n')
+
+
+def _webp(entete):
+    return entete.startswith(b'RIFF') and entete[8:12] == b'WEBP'
+
+
+# Formats acceptés par champ, reconnus à leurs premiers octets ; les pièces
+# jointes ('fichier') peuvent être de tout type.
+FORMATS_TELEVERSEMENT = {
+    'video': (_mp4, _webm),
+    'vocal': (_webm, _ogg, _mp4),
+    'photo': (_jpeg, _png, _webp),
+}
+TAILLE_ENTETE = 12
+
+
+class GestionnaireControleTeleversement(FileUploadHandler):
+    # Placé en tête de FILE_UPLOAD_HANDLERS : laisse passer les données vers
+    # les gestionnaires suivants mais interrompt la requête dès qu'un fichier
+    # dépasse son quota ou ne commence pas comme un format attendu, sans
+    # attendre la fin du corps.
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.taille_requete = content_length
+        return None
+
+    def _refuser(self, motif, message):
+        journal.warning("Téléversement refusé (%s, champ %s) : %s", self.file_name, self.field_name, motif)
+        if self.request is not None:
+            # Lu par les vues pour expliquer le refus : sans cela, le fichier
+            # manquerait simplement au formulaire.
+            self.request.televersement_refuse = message
+        raise StopUpload(connection_reset=True)
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.quota = QUOTAS_TELEVERSEMENT.get(field_name, QUOTA_PAR_DEFAUT)
+        self.formats = FORMATS_TELEVERSEMENT.get(field_name)
+        self.recu = 0
+        self.entete = b''
+
+        taille_annoncee = content_length or max((getattr(self, 'taille_requete', 0) or 0) - MARGE_CHAMPS, 0)
+        if taille_annoncee > self.quota:
+            self._refuser("taille annoncée au-delà du quota", "Fichier trop volumineux.")
+
+    def _verifier_format(self):
+        if not any(format_accepte(self.entete) for format_accepte in self.formats):
+            self._refuser("format non reconnu", "Format de fichier non pris en charge.")
+        self.formats = None
+
+    def receive_data_chunk(self, raw_data, start):
+        self.recu += len(raw_data)
+        if self.recu > self.quota:
+            self._refuser("quota dépassé", "Fichier trop volumineux.")
+
+        if self.formats is not None:
+            self.entete += raw_data[:TAILLE_ENTETE - len(self.entete)]
+            if len(self.entete) >= TAILLE_ENTETE:
+                self._verifier_format()
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.formats is not None:
+            self._verifier_format()
+        return None
+
+
+class GestionnaireFichierTemporaire(TemporaryFileUploadHandler):
+    # Calcule l'empreinte SHA-256 pendant l'écriture du fichier temporaire :
+    # le stockage par empreinte (immobilier.stockage) n'a plus à le relire.
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.empreinte = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.empreinte.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        fichier = super().file_complete(file_size)
+        fichier.empreinte_sha256 = self.empreinte.hexdigest()
+        return fichier
@@ -0,0 +1,339 @@
+import asyncio
+import os
+import random
+import sqlite3
+import string
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import msgpack
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+
+# Nombre maximal de canaux par requête de relève (limite de paramètres SQLite).
+TAILLE_LOT_CANAUX = 500
+
+SQL_CREATION = [
+    """
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        canal TEXT NOT NULL,
+        prefixe TEXT NOT NULL,
+        expiration REAL NOT NULL,
+        contenu BLOB NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS messages_prefixe_idx ON messages (prefixe, id)",
+    "CREATE INDEX IF NOT EXISTS messages_canal_idx ON messages (canal, expiration)",
+    "CREATE INDEX IF NOT EXISTS messages_expiration_idx ON messages (expiration)",
+    """
+    CREATE TABLE IF NOT EXISTS groupes (
+        groupe TEXT NOT NULL,
+        canal TEXT NOT NULL,
+        expiration REAL NOT NULL,
+        PRIMARY KEY (groupe, canal)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS groupes_canal_idx ON groupes (canal)",
+]
+
+
+class CoucheCanauxSQLite(BaseChannelLayer):
+    # Couche de canaux partagée par tous les processus d'une même machine via
+    # un fichier SQLite en WAL. Les canaux propres à un processus
+    # ("...!xxxx") sont stockés sous leur préfixe : un seul scrutateur par
+    # processus les relève et les répartit dans des files asyncio locales.
+    # Comme le tampon de réception de RedisChannelLayer, la file d'un canal
+    # vit aussi longtemps que lui : un message arrivé entre deux receive()
+    # y attend le suivant. Seules les lignes des canaux qui ont une file sont
+    # retirées de la base.
+
+    extensions = ['groups', 'flush']
+
+    def __init__(
+        self,
+        chemin='canaux.sqlite3',
+        expiry=60,
+        group_expiry=86400,
+        capacity=100,
+        channel_capacity=None,
+        intervalle_scrutation=0.05,
+        intervalle_nettoyage=30,
+        **kwargs,
+    ):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+        self.chemin = str(chemin)
+        self.group_expiry = group_expiry
+        self.intervalle_scrutation = intervalle_scrutation
+        self.intervalle_nettoyage = intervalle_nettoyage
+
+        self.canal_processus = f"sqlite.{os.getpid()}.{uuid.uuid4().hex[:8]}!"
+        self._executeur = ThreadPoolExecutor(max_workers=1, thread_name_prefix='couche_canaux')
+        self._connexion = None
+        self._files = {}
+        self._attentes = {}
+        self._activite = {}
+        self._groupes_locaux = {}
+        self._scrutateur = None
+        self._dernier_nettoyage = 0
+        self._dernier_tri_files = 0
+
+    # Accès à la base, toujours depuis le thread unique de l'exécuteur.
+
+    def _base(self):
+        if self._connexion is None:
+            connexion = sqlite3.connect(self.chemin, timeout=5, isolation_level=None)
+            connexion.execute('PRAGMA journal_mode=WAL')
+            connexion.execute('PRAGMA synchronous=NORMAL')
+            for sql in SQL_CREATION:
+                connexion.execute(sql)
+            self._connexion = connexion
+        return self._connexion
+
+    async def _executer(self, fonction, *arguments):
+        boucle = asyncio.get_running_loop()
+        return await boucle.run_in_executor(self._executeur, fonction, *arguments)
+
+    def _inserer(self, envois):
+        base = self._base()
+        maintenant = time.time()
+        pleins = []
+        base.execute('BEGIN IMMEDIATE')
+        try:
+            for canal, contenu in envois:
+                (nombre,) = base.execute(
+                    'SELECT COUNT(*) FROM messages WHERE canal = ? AND expiration >= ?',
+                    (canal, maintenant),
+                ).fetchone()
+                if nombre >= self.get_capacity(canal):
+                    pleins.append(canal)
+                    continue
+                base.execute(
+                    'INSERT INTO messages (canal, prefixe, expiration, contenu) VALUES (?, ?, ?, ?)',
+                    (canal, self.non_local_name(canal), maintenant + self.expiry, contenu),
+                )
+            base.execute('COMMIT')
+        except BaseException:
+            base.execute('ROLLBACK')
+            raise
+        return pleins
+
+    def _relever(self, prefixe, limite=100, canaux=None):
+        # `canaux` : ne relève que les messages de ces canaux, les autres
+        # restent en base jusqu'à ce qu'une file les prenne ou qu'ils expirent.
+        if canaux is not None:
+            messages = []
+            for debut in range(0, len(canaux), TAILLE_LOT_CANAUX):
+                messages += self._relever_lot(prefixe, limite, canaux[debut:debut + TAILLE_LOT_CANAUX])
+            return messages
+        return self._relever_lot(prefixe, limite, None)
+
+    def _relever_lot(self, prefixe, limite, canaux):
+        base = self._base()
+        filtre = 'prefixe = ?'
+        parametres = [prefixe]
+        if canaux is not None:
+            filtre += f" AND canal IN ({','.join('?' * len(canaux))})"
+            parametres += canaux
+        # Lecture simple d'abord : la scrutation à vide ne prend jamais le
+        # verrou d'écriture.
+        if base.execute(f'SELECT 1 FROM messages WHERE {filtre} LIMIT 1', parametres).fetchone() is None:
+            return []
+
+        base.execute('BEGIN IMMEDIATE')
+        try:
+            lignes = base.execute(
+                f'SELECT id, canal, expiration, contenu FROM messages WHERE {filtre} ORDER BY id LIMIT ?',
+                [*parametres, limite],
+            ).fetchall()
+            if lignes:
+                base.execute(
+                    f"DELETE FROM messages WHERE id IN ({','.join('?' * len(lignes))})",
+                    [ligne[0] for ligne in lignes],
+                )
+            base.execute('COMMIT')
+        except BaseException:
+            base.execute('ROLLBACK')
+            raise
+        maintenant = time.time()
+        return [(canal, contenu) for _, canal, expiration, contenu in lignes if expiration >= maintenant]
+
+    def _nettoyer(self):
+        base = self._base()
+        maintenant = time.time()
+        base.execute('BEGIN IMMEDIATE')
+        try:
+            # Un message expiré signale un canal qui ne lit plus : on le retire
+            # de ses groupes, comme InMemoryChannelLayer.
+            base.execute(
+                'DELETE FROM groupes WHERE canal IN (SELECT canal FROM messages WHERE expiration < ?)',
+                (maintenant,),
+            )
+            base.execute('DELETE FROM messages WHERE expiration < ?', (maintenant,))
+            base.execute('DELETE FROM groupes WHERE expiration < ?', (maintenant,))
+            base.execute('COMMIT')
+        except BaseException:
+            base.execute('ROLLBACK')
+            raise
+
+    def _nettoyer_si_necessaire(self):
+        if time.monotonic() - self._dernier_nettoyage >= self.intervalle_nettoyage:
+            self._dernier_nettoyage = time.monotonic()
+            self._nettoyer()
+
+    def _membres(self, groupe):
+        self._nettoyer_si_necessaire()
+        return [
+            canal for (canal,) in self._base().execute(
+                'SELECT canal FROM groupes WHERE groupe = ? AND expiration >= ?',
+                (groupe, time.time()),
+            )
+        ]
+
+    def _ajouter_au_groupe(self, groupe, canal):
+        self._base().execute(
+            'INSERT OR REPLACE INTO groupes (groupe, canal, expiration) VALUES (?, ?, ?)',
+            (groupe, canal, time.time() + self.group_expiry),
+        )
+
+    def _retirer_du_groupe(self, groupe, canal):
+        self._base().execute('DELETE FROM groupes WHERE groupe = ? AND canal = ?', (groupe, canal))
+
+    def _vider(self):
+        base = self._base()
+        base.execute('DELETE FROM messages')
+        base.execute('DELETE FROM groupes')
+
+    def _fermer(self):
+        if self._connexion is not None:
+            self._connexion.close()
+            self._connexion = None
+
+    # API de la couche de canaux
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_channel_name(channel)
+        assert '__asgi_channel__' not in message
+
+        pleins = await self._executer(self._inserer, [(channel, msgpack.packb(message, use_bin_type=True))])
+        if pleins:
+            raise ChannelFull(channel)
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+
+        if '!' not in channel:
+            while True:
+                messages = await self._executer(self._relever, channel, 1)
+                if messages:
+                    return msgpack.unpackb(messages[0][1], raw=False)
+                await asyncio.sleep(self.intervalle_scrutation)
+
+        file = self._file(channel)
+        self._attentes[channel] = self._attentes.get(channel, 0) + 1
+        self._demarrer_scrutateur()
+        try:
+            return await file.get()
+        finally:
+            self._attentes[channel] -= 1
+            self._activite[channel] = time.monotonic()
+
+    def _file(self, canal):
+        if canal not in self._files:
+            self._files[canal] = asyncio.Queue()
+            self._activite[canal] = time.monotonic()
+        return self._files[canal]
+
+    def _oublier_file(self, canal):
+        self._files.pop(canal, None)
+        self._attentes.pop(canal, None)
+        self._activite.pop(canal, None)
+        self._groupes_locaux.pop(canal, None)
+
+    def _oublier_files_inactives(self):
+        # Sans receive() en attente depuis plus que la durée de vie d'un
+        # message, le consommateur a disparu : ce qui reste dans sa file
+        # aurait expiré de toute façon.
+        limite = time.monotonic() - self.expiry
+        for canal in [canal for canal, derniere in self._activite.items() if derniere < limite]:
+            if not self._attentes.get(canal):
+                self._oublier_file(canal)
+
+    async def new_channel(self, prefix='specific.'):
+        aleatoire = ''.join(random.choice(string.ascii_letters) for _ in range(12))
+        return f"{self.canal_processus}{prefix}{aleatoire}"
+
+    def _demarrer_scrutateur(self):
+        if self._scrutateur is None or self._scrutateur.done():
+            self._scrutateur = asyncio.get_running_loop().create_task(self._scruter())
+
+    async def _scruter(self):
+        while self._files:
+            messages = await self._executer(self._relever, self.canal_processus, 100, list(self._files))
+            for canal, contenu in messages:
+                # La ligne est déjà retirée de la base : si la file a été
+                # oubliée entre-temps, on la recrée plutôt que de perdre le
+                # message.
+                self._file(canal).put_nowait(msgpack.unpackb(contenu, raw=False))
+            await self._executer(self._nettoyer_si_necessaire)
+            if time.monotonic() - self._dernier_tri_files >= self.intervalle_nettoyage:
+                self._dernier_tri_files = time.monotonic()
+                self._oublier_files_inactives()
+            if not messages:
+                await asyncio.sleep(self.intervalle_scrutation)
+
+    async def flush(self):
+        self._files = {}
+        self._attentes = {}
+        self._activite = {}
+        self._groupes_locaux = {}
+        await self._executer(self._vider)
+
+    async def close(self):
+        if self._scrutateur is not None:
+            self._scrutateur.cancel()
+            self._scrutateur = None
+        await self._executer(self._fermer)
+
+    # Extension des groupes
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._executer(self._ajouter_au_groupe, group, channel)
+        if '!' in channel:
+            # File créée dès l'abonnement : les messages du groupe sont
+            # relevés même avant le premier receive().
+            self._file(channel)
+            self._groupes_locaux.setdefault(channel, set()).add(group)
+            self._demarrer_scrutateur()
+
+    async def group_discard(self, group, channel):
+        self.require_valid_channel_name(channel)
+        self.require_valid_group_name(group)
+        await self._executer(self._retirer_du_groupe, group, channel)
+        groupes = self._groupes_locaux.get(channel)
+        if groupes is not None:
+            groupes.discard(group)
+            # Déconnexion du consommateur : plus de groupe, personne en
+            # attente et rien à lire.
+            file = self._files.get(channel)
+            if not groupes and not self._attentes.get(channel) and (file is None or file.empty()):
+                self._oublier_file(channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        self.require_valid_group_name(group)
+
+        canaux = await self._executer(self._membres, group)
+        if not canaux:
+            return
+        contenu = msgpack.packb(message, use_bin_type=True)
+        # Comme les autres couches, un canal plein ne bloque pas l'envoi aux
+        # autres membres du groupe.
+        await self._executer(self._inserer, [(canal, contenu) for canal in canaux])
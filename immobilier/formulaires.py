@@ -1,9 +1,12 @@
 from django import forms
 from django.contrib.auth import authenticate
-from django.core.exceptions import ValidationError
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from PIL import Image
 
-from .models import Adresse, Message, Publication, Signalement, Utilisateur
+from .images import normaliser_photo
+from .models import Adresse, Message, Publication, Signalement, TeleversementFragmente, Utilisateur
 from .services import generer_propositions_noms_utilisateur
+from .televersements import fichier_assemble
 
 
 class FormulaireConnexion(forms.Form):
@@ -27,6 +30,13 @@ class FormulaireConnexion(forms.Form):
 class FormulairePhotoProfil(forms.Form):
     photo = forms.ImageField(label='Photo de profil')
 
+    def clean_photo(self):
+        photo = self.cleaned_data['photo']
+        try:
+            return normaliser_photo(photo)
+        except (OSError, Image.DecompressionBombError):
+            raise ValidationError("Image illisible.")
+
 
 class FormulaireSignalement(forms.ModelForm):
     class Meta:
@@ -114,6 +124,9 @@ class FormulaireAdresse(forms.ModelForm):
     class Meta:
         model = Adresse
         fields = ['avenue', 'numero', 'quartier', 'commune', 'niveau', 'code_appartement']
+        error_messages = {
+            NON_FIELD_ERRORS: {'unique_together': "Cette adresse exacte existe déjà."},
+        }
 
     def clean(self):
         donnees = super().clean()
@@ -127,12 +140,32 @@ class FormulaireAdresse(forms.ModelForm):
 
 
 class FormulairePublicationBien(forms.ModelForm):
+    # Identifiant d'un téléversement fragmenté terminé, à la place du champ
+    # vidéo classique.
+    televersement = forms.UUIDField(required=False, widget=forms.HiddenInput)
+
     class Meta:
         model = Publication
         fields = ['video', 'titre', 'description', 'prix', 'statut_transaction', 'est_disponible']
 
+    def __init__(self, *args, utilisateur=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.utilisateur = utilisateur
+        self.fields['video'].required = False
+
+    def clean_televersement(self):
+        identifiant = self.cleaned_data.get('televersement')
+        if not identifiant:
+            return None
+        televersement = TeleversementFragmente.objects.filter(identifiant=identifiant, utilisateur=self.utilisateur).first()
+        if televersement is None or not televersement.est_termine:
+            raise ValidationError("Le téléversement de la vidéo n'est pas terminé.")
+        return televersement
+
     def clean(self):
         donnees = super().clean()
+        if not donnees.get('video') and donnees.get('televersement'):
+            donnees['video'] = fichier_assemble(donnees['televersement'])
         if not donnees.get('video'):
             raise ValidationError({'video': 'La vidéo est obligatoire.'})
 
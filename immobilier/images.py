@@ -0,0 +1,92 @@
+import os
+import re
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+
+DIMENSION_MAX_PHOTO = 1080
+QUALITE_PHOTO = 85
+
+# 96 pour les avatars jusqu'à 48 px, 192 pour ceux des pages de profil, en
+# comptant les écrans haute densité.
+TAILLES_MINIATURES = (96, 192)
+TAILLE_AVATAR = 96
+QUALITE_MINIATURE = 80
+
+DOSSIER_MINIATURES = 'miniatures/'
+DOSSIERS_SOURCES_MINIATURES = ('photos_utilisateurs/',)
+
+MOTIF_MINIATURE = re.compile(r'^miniatures/(?P<taille>\d+)/(?P<source>.+)\.webp$')
+
+
+def normaliser_photo(fichier):
+    # Redresse selon l'EXIF puis réenregistre sans métadonnées : ni
+    # géolocalisation ni photo de 12 Mpx servie comme avatar. Une image
+    # transparente (PNG, WebP) reste transparente, en WebP ; les autres
+    # passent en JPEG.
+    with Image.open(fichier) as image:
+        image = ImageOps.exif_transpose(image)
+        transparente = image.has_transparency_data
+        if transparente:
+            image = image.convert('RGBA')
+        elif image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.thumbnail((DIMENSION_MAX_PHOTO, DIMENSION_MAX_PHOTO), Image.Resampling.LANCZOS)
+        sortie = BytesIO()
+        if transparente:
+            image.save(sortie, format='WEBP', quality=QUALITE_PHOTO, method=4)
+            extension = 'webp'
+        else:
+            image.save(sortie, format='JPEG', quality=QUALITE_PHOTO, optimize=True, progressive=True)
+            extension = 'jpg'
+    nom = Path(os.path.basename(fichier.name or 'photo')).stem or 'photo'
+    return ContentFile(sortie.getvalue(), name=f"{nom}.{extension}")
+
+
+def nom_miniature(nom_source, taille):
+    return f"{DOSSIER_MINIATURES}{taille}/{nom_source}.webp"
+
+
+def source_miniature(chemin):
+    correspondance = MOTIF_MINIATURE.match(chemin)
+    if correspondance is None or int(correspondance['taille']) not in TAILLES_MINIATURES:
+        return None, None
+    if not correspondance['source'].startswith(DOSSIERS_SOURCES_MINIATURES):
+        return None, None
+    return correspondance['source'], int(correspondance['taille'])
+
+
+def generer_miniature(chemin):
+    # Générée à la première demande puis servie depuis le disque : le nom de
+    # la source change à chaque nouvelle photo, la miniature n'est jamais
+    # périmée.
+    source, taille = source_miniature(chemin)
+    if source is None:
+        return None
+
+    chemin_source = Path(settings.MEDIA_ROOT) / source
+    destination = Path(settings.MEDIA_ROOT) / chemin
+    if destination.exists():
+        return destination
+
+    with Image.open(chemin_source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGB')
+        image = ImageOps.fit(image, (taille, taille), Image.Resampling.LANCZOS)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        descripteur, chemin_temporaire = tempfile.mkstemp(dir=destination.parent, suffix='.webp.tmp')
+        try:
+            with os.fdopen(descripteur, 'wb') as sortie:
+                image.save(sortie, format='WEBP', quality=QUALITE_MINIATURE, method=4)
+            os.chmod(chemin_temporaire, 0o644)
+            os.replace(chemin_temporaire, destination)
+        except BaseException:
+            os.unlink(chemin_temporaire)
+            raise
+    return destination
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from immobilier.boite_envoi import INTERVALLE_REPARTITEUR, distribuer_tout
+
+
+class Command(BaseCommand):
+    help = "Diffuse les événements en attente de la boîte d'envoi vers la couche de canaux."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--une-fois', action='store_true', help="Vide la boîte d'envoi puis s'arrête.")
+        parser.add_argument('--intervalle', type=float, default=INTERVALLE_REPARTITEUR)
+
+    def handle(self, *args, **options):
+        while True:
+            total = distribuer_tout()
+            if total or options['verbosity'] >= 2:
+                self.stdout.write(f"{total} événement(s) diffusé(s).")
+            if options['une_fois']:
+                return
+            time.sleep(options['intervalle'])
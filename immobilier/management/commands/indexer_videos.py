@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from immobilier.models import Publication
+from immobilier.services import preparer_video
+
+
+class Command(BaseCommand):
+    help = "Place l'atome moov en tête des vidéos et relève leur durée, résolution et débit."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--toutes', action='store_true', help="Retraite aussi les vidéos déjà analysées.")
+
+    def handle(self, *args, **options):
+        publications = Publication.objects.exclude(video='').only('id', 'video').order_by('id')
+        if not options['toutes']:
+            publications = publications.filter(duree__isnull=True)
+
+        analysees = 0
+        echecs = 0
+        for publication in publications.iterator():
+            if preparer_video(publication) is None:
+                echecs += 1
+                if options['verbosity'] >= 2:
+                    self.stdout.write(f"Vidéo illisible : {publication.video.name}")
+            else:
+                analysees += 1
+
+        self.stdout.write(f"{analysees} vidéo(s) analysée(s), {echecs} illisible(s).")
@@ -0,0 +1,147 @@
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from immobilier.base_donnees import DELAI_INITIAL_REPRISE, DELAI_MAX_REPRISE, TENTATIVES_ECRITURE
+
+
+SQL_CREATION = [
+    "CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, utilisateur INTEGER NOT NULL, contenu TEXT NOT NULL)",
+    "CREATE INDEX messages_utilisateur_idx ON messages (utilisateur, id)",
+    "CREATE TABLE resumes (utilisateur INTEGER PRIMARY KEY, version INTEGER NOT NULL, non_lus INTEGER NOT NULL)",
+]
+NOMBRE_UTILISATEURS = 50
+
+
+def _connecter(chemin, pragmas):
+    connexion = sqlite3.connect(chemin, timeout=5, isolation_level=None)
+    for pragma in pragmas.split(';'):
+        if pragma.strip():
+            connexion.execute(pragma)
+    return connexion
+
+
+def _transaction_ecriture(connexion, debut, utilisateur):
+    # Même forme qu'enregistrer_message : une lecture, puis l'insertion du
+    # message et la mise à jour du résumé.
+    connexion.execute(debut)
+    try:
+        (version,) = connexion.execute('SELECT MAX(version) FROM resumes').fetchone()
+        connexion.execute('INSERT INTO messages (utilisateur, contenu) VALUES (?, ?)', (utilisateur, 'x' * 200))
+        connexion.execute(
+            'UPDATE resumes SET version = ?, non_lus = non_lus + 1 WHERE utilisateur = ?',
+            (version + 1, utilisateur),
+        )
+        connexion.execute('COMMIT')
+    except BaseException:
+        if connexion.in_transaction:
+            connexion.execute('ROLLBACK')
+        raise
+
+
+def _ecrire(connexion, debut, reprise, utilisateur):
+    delai = DELAI_INITIAL_REPRISE
+    tentatives = TENTATIVES_ECRITURE if reprise else 1
+    for tentative in range(1, tentatives + 1):
+        try:
+            return _transaction_ecriture(connexion, debut, utilisateur)
+        except sqlite3.OperationalError:
+            if tentative == tentatives:
+                raise
+        time.sleep(delai * random.uniform(0.5, 1.5))
+        delai = min(delai * 2, DELAI_MAX_REPRISE)
+
+
+def _fil(chemin, pragmas, debut, reprise, fin, resultats):
+    connexion = _connecter(chemin, pragmas)
+    ecritures, echecs, latences = 0, 0, []
+    while time.monotonic() < fin:
+        utilisateur = random.randrange(NOMBRE_UTILISATEURS)
+        try:
+            connexion.execute(
+                'SELECT id, contenu FROM messages WHERE utilisateur = ? ORDER BY id DESC LIMIT 50', (utilisateur,)
+            ).fetchall()
+            depart = time.monotonic()
+            _ecrire(connexion, debut, reprise, utilisateur)
+        except sqlite3.OperationalError:
+            echecs += 1
+            continue
+        latences.append(time.monotonic() - depart)
+        ecritures += 1
+    connexion.close()
+    resultats.append((ecritures, echecs, latences))
+
+
+def _processus(chemin, pragmas, debut, reprise, nombre_threads, duree):
+    # Un processus par worker gunicorn, avec ses threads.
+    fin = time.monotonic() + duree
+    resultats = []
+    fils = [
+        threading.Thread(target=_fil, args=(chemin, pragmas, debut, reprise, fin, resultats))
+        for _ in range(nombre_threads)
+    ]
+    for fil in fils:
+        fil.start()
+    for fil in fils:
+        fil.join()
+    return resultats
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare le débit d'écriture concurrente sur une base SQLite jetable : réglages par défaut de "
+        "Django contre ceux de DATABASES['default'] (WAL, BEGIN IMMEDIATE, reprise)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processus', type=int, default=2)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--duree', type=float, default=5, help="Durée de chaque mesure, en secondes.")
+
+    def handle(self, *args, **options):
+        reglages = settings.DATABASES['default'].get('OPTIONS', {})
+        transaction_mode = reglages.get('transaction_mode')
+        configurations = [
+            ('par défaut', '', 'BEGIN', False),
+            ('réglée', reglages.get('init_command', ''), f"BEGIN {transaction_mode or ''}".strip(), True),
+        ]
+
+        self.stdout.write(
+            f"{options['processus']} processus × {options['threads']} threads, {options['duree']:g} s par mesure."
+        )
+        with tempfile.TemporaryDirectory() as dossier:
+            for numero, (nom, pragmas, debut, reprise) in enumerate(configurations):
+                chemin = str(Path(dossier) / f"mesure_{numero}.sqlite3")
+                connexion = _connecter(chemin, pragmas)
+                for sql in SQL_CREATION:
+                    connexion.execute(sql)
+                connexion.executemany(
+                    'INSERT INTO resumes (utilisateur, version, non_lus) VALUES (?, 0, 0)',
+                    [(utilisateur,) for utilisateur in range(NOMBRE_UTILISATEURS)],
+                )
+                connexion.close()
+
+                with ProcessPoolExecutor(max_workers=options['processus']) as executeur:
+                    futurs = [
+                        executeur.submit(_processus, chemin, pragmas, debut, reprise, options['threads'], options['duree'])
+                        for _ in range(options['processus'])
+                    ]
+                    resultats = [resultat for futur in futurs for resultat in futur.result()]
+
+                ecritures = sum(resultat[0] for resultat in resultats)
+                echecs = sum(resultat[1] for resultat in resultats)
+                latences = sorted(latence for resultat in resultats for latence in resultat[2])
+                p95 = latences[int(len(latences) * 0.95)] * 1000 if latences else 0
+                mediane = statistics.median(latences) * 1000 if latences else 0
+                self.stdout.write(
+                    f"{nom:>10} : {ecritures / options['duree']:8.1f} écritures/s, {echecs} échec(s) "
+                    f"« database is locked », latence médiane {mediane:.1f} ms, p95 {p95:.1f} ms"
+                )
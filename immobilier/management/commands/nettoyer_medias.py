@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from immobilier.nettoyage_medias import DELAI_GRACE, nettoyer_medias
+
+
+class Command(BaseCommand):
+    help = "Repère les médias qu'aucune ligne ne référence plus ; les supprime avec --supprimer."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--supprimer', action='store_true', help="Supprime les orphelins au lieu de seulement les lister.")
+        parser.add_argument(
+            '--delai-heures', type=float, default=DELAI_GRACE.total_seconds() / 3600,
+            help="Âge minimal d'un fichier avant qu'il puisse être supprimé.",
+        )
+        parser.add_argument('--intervalle', type=float, help="Recommence toutes les N secondes au lieu de s'arrêter.")
+
+    def handle(self, *args, **options):
+        delai = timedelta(hours=options['delai_heures'])
+        simulation = not options['supprimer']
+        detailler = simulation and options['verbosity'] >= 2
+
+        while True:
+            bilan = nettoyer_medias(delai=delai, simulation=simulation, rapporter=self.rapporter if detailler else None)
+            verbe = "à supprimer" if simulation else f"dont {bilan.supprimes} supprimé(s)"
+            self.stdout.write(
+                f"{bilan.examines} fichier(s) examiné(s), {bilan.orphelins} orphelin(s) {verbe} "
+                f"({filesizeformat(bilan.octets)}), {bilan.references_corrigees} compteur(s) de références "
+                f"{'à corriger' if simulation else 'corrigé(s)'}, {bilan.televersements_abandonnes} téléversement(s) abandonné(s)."
+            )
+            if options['intervalle'] is None:
+                return
+            time.sleep(options['intervalle'])
+
+    def rapporter(self, nom, taille):
+        self.stdout.write(f"{nom} ({filesizeformat(taille)})")
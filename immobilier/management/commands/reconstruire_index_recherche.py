@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from immobilier.recherche import recherche_disponible, reconstruire_index_recherche
+
+
+class Command(BaseCommand):
+    help = "Recrée la table FTS5 des publications, ses triggers, et la remplit à partir des données existantes."
+
+    def handle(self, *args, **options):
+        if not recherche_disponible():
+            raise CommandError('La recherche plein texte nécessite SQLite (FTS5).')
+
+        reconstruire_index_recherche()
+        self.stdout.write(self.style.SUCCESS('Index de recherche reconstruit.'))
@@ -0,0 +1,156 @@
+import re
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models
+
+from immobilier.models import Adresse, Message, Publication, ResumeConversation
+from immobilier.nettoyage_medias import champs_medias
+from immobilier.pagination import filtre_apres
+from immobilier.vues import CHAMPS_MEDIAS_PRIVES, ORDRE_PERTINENCE, ORDRES_TRI_PUBLICATIONS, _filtrer_publications, _messages_avant, _messages_conversation, _resumes_conversations
+
+
+MOTIF_PARCOURS_COMPLET = re.compile(r'^SCAN (?P<table>\S+)$')
+
+VALEURS_EXEMPLE = {
+    'date_creation': datetime(2026, 1, 1, tzinfo=timezone.utc),
+    'prix': 1000,
+    'pertinence': -1.0,
+    'id': 1,
+}
+
+FILTRES_RECHERCHE = [
+    {'statut_transaction': 'A_LOUER', 'disponibilite': '1'},
+    {'statut_transaction': 'A_VENDRE', 'disponibilite': '0', 'prix_min': '100', 'prix_max': '5000'},
+    {'disponibilite': '1', 'prix_max': '5000'},
+    {'q': 'appartement meublé', 'disponibilite': '1'},
+    {'quartier': 'gombe', 'commune': 'gombe', 'statut_transaction': 'A_LOUER'},
+]
+
+
+def _page(publications, ordre, avec_curseur):
+    publications = publications.order_by(*ordre)
+    if avec_curseur:
+        valeurs = [VALEURS_EXEMPLE[cle.lstrip('-')] for cle in ordre]
+        publications = publications.filter(filtre_apres(ordre, valeurs))
+    return publications[:11]
+
+
+def requetes_par_vue():
+    requetes = []
+
+    for tri, ordre in ORDRES_TRI_PUBLICATIONS.items():
+        for avec_curseur in [False, True]:
+            publications = Publication.objects.select_related('proprietaire', 'adresse')
+            libelle = f"tri={tri}{' curseur' if avec_curseur else ''}"
+            requetes.append(('afficher_feed', libelle, _page(publications, ordre, avec_curseur)))
+
+    for filtres in FILTRES_RECHERCHE:
+        valeurs = {cle: '' for cle in ['q', 'quartier', 'commune', 'statut_transaction', 'disponibilite', 'prix_min', 'prix_max']}
+        valeurs.update(filtres)
+        ordres = dict(ORDRES_TRI_PUBLICATIONS)
+        if valeurs['q']:
+            ordres['pertinence'] = ORDRE_PERTINENCE
+        for tri, ordre in ordres.items():
+            publications, _ = _filtrer_publications(Publication.objects.select_related('proprietaire', 'adresse'), valeurs)
+            libelle = f"{filtres} tri={tri}"
+            requetes.append(('afficher_recherche', libelle, _page(publications, ordre, True)))
+
+    requetes.append((
+        'afficher_profil',
+        'publications du propriétaire',
+        Publication.objects.filter(proprietaire_id=1).select_related('adresse').order_by('-date_creation'),
+    ))
+
+    requetes.extend([
+        (
+            'api_liste_conversations',
+            'conversations par dernière activité',
+            _resumes_conversations(1),
+        ),
+        (
+            'api_liste_conversations',
+            'conversations modifiées depuis une version',
+            _resumes_conversations(1).filter(version__gt=1),
+        ),
+        (
+            'api_liste_messages',
+            'messages depuis_id',
+            _messages_conversation(1).filter(id__gt=1).order_by('id')[:200],
+        ),
+        (
+            'afficher_messages_prives',
+            'fenêtre la plus récente',
+            _messages_avant(1),
+        ),
+        (
+            'api_liste_messages',
+            'messages avant_id',
+            _messages_avant(1, 1000),
+        ),
+        (
+            'api_marquer_conversation_lue',
+            'non lus après le dernier message lu',
+            Message.objects.filter(conversation_id=1, id__gt=1).exclude(expediteur_id=1),
+        ),
+        (
+            'api_nombre_non_lus',
+            'total des non lus',
+            ResumeConversation.objects.filter(utilisateur_id=1).values('utilisateur_id').annotate(total=models.Sum('nombre_non_lus')),
+        ),
+    ])
+
+    for dossier, champ in CHAMPS_MEDIAS_PRIVES.items():
+        requetes.append((
+            'servir_media',
+            f"conversation d'un média {dossier}",
+            Message.objects.filter(**{champ: f"{dossier}exemple"}).order_by().values_list('conversation_id', flat=True).distinct(),
+        ))
+
+    requetes.append((
+        'lieux_connus',
+        'communes et quartiers distincts',
+        Adresse.objects.order_by('commune', 'quartier').values_list('commune', 'quartier').distinct(),
+    ))
+
+    for modele, champ, dossier in champs_medias():
+        requetes.append((
+            'nettoyer_medias',
+            f"références d'un lot de {dossier}",
+            modele.objects.filter(**{f"{champ}__in": [f"{dossier}a", f"{dossier}b"]}).order_by().values_list(champ, flat=True),
+        ))
+
+    return requetes
+
+
+def plan_requete(queryset):
+    sql, parametres = queryset.query.sql_with_params()
+    with connection.cursor() as curseur:
+        curseur.execute(f"EXPLAIN QUERY PLAN {sql}", parametres)
+        return [ligne[-1] for ligne in curseur.fetchall()]
+
+
+class Command(BaseCommand):
+    help = "Exécute EXPLAIN QUERY PLAN sur les requêtes des vues et échoue si l'une d'elles parcourt une table entière."
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Cette vérification ne concerne que SQLite.')
+
+        echecs = []
+        for vue, libelle, queryset in requetes_par_vue():
+            plan = plan_requete(queryset)
+            parcours = [etape for etape in plan if MOTIF_PARCOURS_COMPLET.match(etape.strip())]
+
+            if options['verbosity'] >= 2 or parcours:
+                self.stdout.write(f"{vue} — {libelle}")
+                for etape in plan:
+                    self.stdout.write(f"    {etape}")
+
+            if parcours:
+                echecs.append(f"{vue} — {libelle} : {', '.join(parcours)}")
+
+        if echecs:
+            raise CommandError('Parcours complet de table détecté :\n' + '\n'.join(echecs))
+
+        self.stdout.write(self.style.SUCCESS('Aucune requête ne parcourt une table entière.'))
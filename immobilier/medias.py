@@ -0,0 +1,110 @@
+import mimetypes
+import os
+import re
+
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+
+DUREE_CACHE_MEDIAS = 30 * 24 * 60 * 60
+
+MOTIF_PLAGE = re.compile(r'^bytes=(?P<debut>\d*)-(?P<fin>\d*)$')
+
+
+class PlageFichier:
+    # Vue bornée d'un fichier ouvert sans tampon : la position du descripteur
+    # reste celle de la plage, si bien que le file_wrapper du serveur WSGI
+    # (sendfile chez gunicorn) envoie directement les octets demandés.
+
+    def __init__(self, fichier, debut, longueur):
+        self._fichier = fichier
+        self._restant = longueur
+        self.name = fichier.name
+        fichier.seek(debut)
+
+    def read(self, taille=-1):
+        if self._restant <= 0:
+            return b''
+        if taille is None or taille < 0 or taille > self._restant:
+            taille = self._restant
+        donnees = self._fichier.read(taille)
+        self._restant -= len(donnees)
+        return donnees
+
+    def fileno(self):
+        return self._fichier.fileno()
+
+    def close(self):
+        self._fichier.close()
+
+
+def etag_fichier(etat):
+    return f'"{etat.st_size:x}-{etat.st_mtime_ns:x}"'
+
+
+def _plage_demandee(request, taille, etag, derniere_modification):
+    entete = request.headers.get('Range', '').strip()
+    correspondance = MOTIF_PLAGE.match(entete)
+    # Plages multiples ou mal formées : on renvoie le fichier entier, ce que
+    # la RFC 9110 autorise.
+    if correspondance is None:
+        return None
+
+    si_plage = request.headers.get('If-Range', '').strip()
+    if si_plage:
+        if si_plage.startswith('"') or si_plage.startswith('W/'):
+            if si_plage != etag:
+                return None
+        elif parse_http_date_safe(si_plage) != derniere_modification:
+            return None
+
+    debut, fin = correspondance['debut'], correspondance['fin']
+    if not debut and not fin:
+        return None
+    if not debut:
+        longueur = min(int(fin), taille)
+        return (taille - longueur, taille - 1) if longueur else False
+    debut = int(debut)
+    fin = min(int(fin), taille - 1) if fin else taille - 1
+    if debut >= taille or fin < debut:
+        return False
+    return debut, fin
+
+
+def reponse_fichier(request, chemin, prive=False):
+    etat = os.stat(chemin)
+    etag = etag_fichier(etat)
+    derniere_modification = int(etat.st_mtime)
+    type_contenu = mimetypes.guess_type(chemin)[0] or 'application/octet-stream'
+
+    def entetes(reponse):
+        reponse['ETag'] = etag
+        reponse['Last-Modified'] = http_date(derniere_modification)
+        reponse['Accept-Ranges'] = 'bytes'
+        reponse['Cache-Control'] = f"{'private' if prive else 'public'}, max-age={DUREE_CACHE_MEDIAS}"
+        return reponse
+
+    conditionnelle = get_conditional_response(request, etag=etag, last_modified=derniere_modification)
+    if conditionnelle is not None:
+        return entetes(conditionnelle)
+
+    plage = _plage_demandee(request, etat.st_size, etag, derniere_modification)
+    if plage is False:
+        reponse = HttpResponse(status=416)
+        reponse['Content-Range'] = f"bytes */{etat.st_size}"
+        return entetes(reponse)
+
+    debut, fin = plage or (0, etat.st_size - 1)
+    longueur = max(fin - debut + 1, 0)
+    fichier = open(chemin, 'rb', buffering=0)
+    if request.method == 'HEAD':
+        fichier.close()
+        reponse = HttpResponse(content_type=type_contenu)
+    else:
+        reponse = FileResponse(PlageFichier(fichier, debut, longueur), content_type=type_contenu)
+    reponse['Content-Length'] = str(longueur)
+    if plage:
+        reponse.status_code = 206
+        reponse['Content-Range'] = f"bytes {debut}-{fin}/{etat.st_size}"
+    return entetes(reponse)
@@ -0,0 +1,53 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immobilier', '0003_message_est_lu_message_type_message_message_vocal'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'id'], name='msg_conversation_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('est_lu', False)), fields=['conversation', 'expediteur'], name='msg_non_lus_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='publication',
+            index=models.Index(fields=['-date_creation', '-id'], name='pub_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='publication',
+            index=models.Index(fields=['prix', '-date_creation', '-id'], name='pub_prix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='publication',
+            index=models.Index(fields=['-prix', '-date_creation', '-id'], name='pub_prix_desc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='publication',
+            index=models.Index(condition=models.Q(('est_disponible', True)), fields=['-date_creation', '-id'], name='pub_dispo_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='publication',
+            index=models.Index(condition=models.Q(('est_disponible', True)), fields=['prix', '-date_creation', '-id'], name='pub_dispo_prix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='publication',
+            index=models.Index(condition=models.Q(('est_disponible', True)), fields=['statut_transaction', '-date_creation', '-id'], name='pub_dispo_statut_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='publication',
+            index=models.Index(condition=models.Q(('est_disponible', True)), fields=['statut_transaction', 'prix', '-date_creation', '-id'], name='pub_dispo_statut_prix_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='publication',
+            index=models.Index(fields=['proprietaire', '-date_creation'], name='pub_proprietaire_recent_idx'),
+        ),
+    ]
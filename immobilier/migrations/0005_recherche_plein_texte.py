@@ -0,0 +1,84 @@
+from django.db import migrations
+
+
+# Figé ici plutôt qu'importé de immobilier.recherche : une modification
+# ultérieure de ce module ne doit pas changer ce que fait cette migration.
+SQL_CREATION = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS immobilier_publication_fts USING fts5(
+        titre, description, avenue, quartier, commune,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3 4'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS immobilier_publication_fts_insertion
+    AFTER INSERT ON immobilier_publication BEGIN
+        INSERT INTO immobilier_publication_fts (rowid, titre, description, avenue, quartier, commune)
+        SELECT new.id, new.titre, new.description, a.avenue, a.quartier, a.commune
+        FROM immobilier_adresse a WHERE a.id = new.adresse_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS immobilier_publication_fts_modification
+    AFTER UPDATE OF titre, description, adresse_id ON immobilier_publication BEGIN
+        DELETE FROM immobilier_publication_fts WHERE rowid = old.id;
+        INSERT INTO immobilier_publication_fts (rowid, titre, description, avenue, quartier, commune)
+        SELECT new.id, new.titre, new.description, a.avenue, a.quartier, a.commune
+        FROM immobilier_adresse a WHERE a.id = new.adresse_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS immobilier_publication_fts_suppression
+    AFTER DELETE ON immobilier_publication BEGIN
+        DELETE FROM immobilier_publication_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS immobilier_publication_fts_adresse
+    AFTER UPDATE OF avenue, quartier, commune ON immobilier_adresse BEGIN
+        UPDATE immobilier_publication_fts
+        SET avenue = new.avenue, quartier = new.quartier, commune = new.commune
+        WHERE rowid IN (SELECT id FROM immobilier_publication WHERE adresse_id = new.id);
+    END
+    """,
+]
+
+SQL_REMPLISSAGE = """
+    INSERT INTO immobilier_publication_fts (rowid, titre, description, avenue, quartier, commune)
+    SELECT p.id, p.titre, p.description, a.avenue, a.quartier, a.commune
+    FROM immobilier_publication p JOIN immobilier_adresse a ON a.id = p.adresse_id
+"""
+
+SQL_SUPPRESSION = [
+    "DROP TRIGGER IF EXISTS immobilier_publication_fts_insertion",
+    "DROP TRIGGER IF EXISTS immobilier_publication_fts_modification",
+    "DROP TRIGGER IF EXISTS immobilier_publication_fts_suppression",
+    "DROP TRIGGER IF EXISTS immobilier_publication_fts_adresse",
+    "DROP TABLE IF EXISTS immobilier_publication_fts",
+]
+
+
+def creer_index_recherche(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in SQL_SUPPRESSION + SQL_CREATION + [SQL_REMPLISSAGE]:
+        schema_editor.execute(sql)
+
+
+def supprimer_index_recherche(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in SQL_SUPPRESSION:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immobilier', '0004_index_requetes_chaudes'),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_index_recherche, supprimer_index_recherche),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def remplir_resumes(apps, schema_editor):
+    Conversation = apps.get_model('immobilier', 'Conversation')
+    Message = apps.get_model('immobilier', 'Message')
+    ResumeConversation = apps.get_model('immobilier', 'ResumeConversation')
+
+    for conversation in Conversation.objects.all().iterator():
+        messages = Message.objects.filter(conversation_id=conversation.id)
+        dernier = messages.order_by('-id').first()
+        participants = [
+            (conversation.proprietaire_id, conversation.demandeur_id),
+            (conversation.demandeur_id, conversation.proprietaire_id),
+        ]
+        for utilisateur_id, contact_id in participants:
+            ResumeConversation.objects.create(
+                conversation_id=conversation.id,
+                utilisateur_id=utilisateur_id,
+                contact_id=contact_id,
+                dernier_message_id=dernier.id if dernier else None,
+                date_derniere_activite=dernier.date_creation if dernier else conversation.date_creation,
+                nombre_non_lus=messages.filter(est_lu=False).exclude(expediteur_id=utilisateur_id).count(),
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immobilier', '0005_recherche_plein_texte'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumeConversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_derniere_activite', models.DateTimeField(default=django.utils.timezone.now)),
+                ('nombre_non_lus', models.PositiveIntegerField(default=0)),
+                ('contact', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumes', to='immobilier.conversation')),
+                ('dernier_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='immobilier.message')),
+                ('utilisateur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumes_conversations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['utilisateur', '-date_derniere_activite'], name='resume_activite_idx')],
+                'constraints': [models.UniqueConstraint(fields=('conversation', 'utilisateur'), name='unicite_resume_par_conversation_et_utilisateur')],
+            },
+        ),
+        migrations.RunPython(remplir_resumes, migrations.RunPython.noop),
+    ]
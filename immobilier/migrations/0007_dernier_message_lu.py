@@ -0,0 +1,85 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:53
+
+from django.db import migrations, models
+
+
+def convertir_indicateurs_lecture(apps, schema_editor):
+    Conversation = apps.get_model('immobilier', 'Conversation')
+    Message = apps.get_model('immobilier', 'Message')
+
+    derniers_lus = (
+        Message.objects
+        .filter(est_lu=True)
+        .values('conversation_id', 'expediteur_id')
+        .annotate(dernier_id=models.Max('id'))
+    )
+    par_conversation = {}
+    for ligne in derniers_lus:
+        par_conversation.setdefault(ligne['conversation_id'], {})[ligne['expediteur_id']] = ligne['dernier_id']
+
+    for conversation in Conversation.objects.filter(id__in=par_conversation.keys()).iterator():
+        derniers = par_conversation[conversation.id]
+        conversation.dernier_message_lu_proprietaire = derniers.get(conversation.demandeur_id, 0)
+        conversation.dernier_message_lu_demandeur = derniers.get(conversation.proprietaire_id, 0)
+        conversation.save(update_fields=['dernier_message_lu_proprietaire', 'dernier_message_lu_demandeur'])
+
+    ResumeConversation = apps.get_model('immobilier', 'ResumeConversation')
+    for resume in ResumeConversation.objects.select_related('conversation').iterator():
+        conversation = resume.conversation
+        if resume.utilisateur_id == conversation.proprietaire_id:
+            dernier_lu = conversation.dernier_message_lu_proprietaire
+        else:
+            dernier_lu = conversation.dernier_message_lu_demandeur
+        resume.nombre_non_lus = (
+            Message.objects
+            .filter(conversation_id=conversation.id, id__gt=dernier_lu)
+            .exclude(expediteur_id=resume.utilisateur_id)
+            .count()
+        )
+        resume.save(update_fields=['nombre_non_lus'])
+
+
+def restaurer_indicateurs_lecture(apps, schema_editor):
+    Conversation = apps.get_model('immobilier', 'Conversation')
+    Message = apps.get_model('immobilier', 'Message')
+
+    for conversation in Conversation.objects.iterator():
+        Message.objects.filter(
+            conversation_id=conversation.id,
+            expediteur_id=conversation.demandeur_id,
+            id__lte=conversation.dernier_message_lu_proprietaire,
+        ).update(est_lu=True)
+        Message.objects.filter(
+            conversation_id=conversation.id,
+            expediteur_id=conversation.proprietaire_id,
+            id__lte=conversation.dernier_message_lu_demandeur,
+        ).update(est_lu=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immobilier', '0006_resumeconversation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='dernier_message_lu_demandeur',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='dernier_message_lu_proprietaire',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(convertir_indicateurs_lecture, restaurer_indicateurs_lecture),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='msg_non_lus_idx',
+        ),
+        migrations.RemoveField(
+            model_name='message',
+            name='est_lu',
+        ),
+    ]
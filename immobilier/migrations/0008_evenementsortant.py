@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:01
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immobilier', '0007_dernier_message_lu'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EvenementSortant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('groupe', models.CharField(max_length=100)),
+                ('donnees', models.JSONField()),
+                ('tentatives', models.PositiveSmallIntegerField(default=0)),
+                ('prochaine_tentative', models.DateTimeField(default=django.utils.timezone.now)),
+                ('jeton', models.CharField(blank=True, default='', max_length=32)),
+                ('date_reservation', models.DateTimeField(blank=True, null=True)),
+                ('date_creation', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['prochaine_tentative', 'id'], name='evenement_a_envoyer_idx'), models.Index(condition=models.Q(('jeton', ''), _negated=True), fields=['jeton'], name='evenement_jeton_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immobilier', '0008_evenementsortant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resumeconversation',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='resumeconversation',
+            index=models.Index(fields=['utilisateur', 'version'], name='resume_version_idx'),
+        ),
+    ]
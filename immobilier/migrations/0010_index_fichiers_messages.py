@@ -0,0 +1,21 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immobilier', '0009_version_resume_conversation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['fichier'], name='msg_fichier_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['vocal'], name='msg_vocal_idx'),
+        ),
+    ]
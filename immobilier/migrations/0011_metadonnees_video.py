@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immobilier', '0010_index_fichiers_messages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='publication',
+            name='debit',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='publication',
+            name='duree',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='publication',
+            name='hauteur',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='publication',
+            name='largeur',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
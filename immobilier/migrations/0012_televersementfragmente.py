@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:11
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immobilier', '0011_metadonnees_video'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeleversementFragmente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('identifiant', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('nom_fichier', models.CharField(max_length=255)),
+                ('taille', models.PositiveBigIntegerField()),
+                ('decalage', models.PositiveBigIntegerField(default=0)),
+                ('date_creation', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('date_modification', models.DateTimeField(default=django.utils.timezone.now)),
+                ('utilisateur', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='televersements', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immobilier', '0012_televersementfragmente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferenceMedia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(max_length=255, unique=True)),
+                ('references', models.PositiveIntegerField(default=1)),
+                ('taille', models.PositiveBigIntegerField(default=0)),
+                ('date_creation', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immobilier', '0014_index_medias'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='adresse',
+            index=models.Index(fields=['commune', 'quartier'], name='adresse_lieux_idx'),
+        ),
+    ]
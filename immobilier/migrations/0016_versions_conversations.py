@@ -0,0 +1,43 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:34
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def initialiser_versions(apps, schema_editor):
+    # Repart de la plus haute version déjà servie, pour qu'aucun client ne
+    # reçoive un 304 sur une liste qui a changé.
+    Utilisateur = apps.get_model('immobilier', 'Utilisateur')
+    ResumeConversation = apps.get_model('immobilier', 'ResumeConversation')
+    Utilisateur.objects.update(
+        version_conversations=Coalesce(
+            models.Subquery(
+                ResumeConversation.objects
+                .filter(utilisateur_id=models.OuterRef('pk'))
+                .order_by('-version')
+                .values('version')[:1]
+            ),
+            0,
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('immobilier', '0015_index_lieux_adresse'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='utilisateur',
+            name='version_conversations',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='utilisateur',
+            name='version_suppression_conversations',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(initialiser_versions, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
@@ -45,11 +47,22 @@ class Utilisateur(AbstractBaseUser, PermissionsMixin):
 
     date_creation = models.DateTimeField(default=timezone.now, editable=False)
 
+    # Version de la liste des conversations : ne fait que croître, y compris
+    # quand une conversation est supprimée, pour ne jamais resservir une
+    # version déjà vue par un client.
+    version_conversations = models.PositiveBigIntegerField(default=0, editable=False)
+    version_suppression_conversations = models.PositiveBigIntegerField(default=0, editable=False)
+
     objects = GestionnaireUtilisateur()
 
     USERNAME_FIELD = 'nom_utilisateur'
     REQUIRED_FIELDS = ['prenom', 'nom', 'poste_nom']
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['photo'], name='utilisateur_photo_idx'),
+        ]
+
     def clean(self):
         super().clean()
         if self.pk:
@@ -86,11 +99,20 @@ class Adresse(models.Model):
                 name='unicite_adresse_exacte',
             ),
         ]
+        indexes = [
+            models.Index(fields=['commune', 'quartier'], name='adresse_lieux_idx'),
+        ]
 
     def __str__(self):
         return f"{self.avenue} {self.numero}, {self.quartier}, {self.commune}, niv. {self.niveau}, {self.code_appartement}"
 
 
+# Au-delà de ces débits (bits/s), le fil ne précharge plus la vidéo en entier,
+# puis plus du tout : elle n'est chargée qu'une fois à l'écran.
+DEBIT_PRECHARGEMENT_COMPLET = 2_500_000
+DEBIT_PRECHARGEMENT_MAX = 8_000_000
+
+
 class Publication(models.Model):
     class StatutTransaction(models.TextChoices):
         A_LOUER = 'A_LOUER', 'À louer'
@@ -106,13 +128,43 @@ class Publication(models.Model):
     statut_transaction = models.CharField(max_length=20, choices=StatutTransaction.choices)
     est_disponible = models.BooleanField(default=True)
 
+    # Relevés dans le fichier MP4 après l'envoi ; vides si la vidéo n'a pas pu
+    # être analysée.
+    duree = models.FloatField(blank=True, null=True, editable=False)
+    largeur = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    hauteur = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    debit = models.PositiveIntegerField(blank=True, null=True, editable=False)
+
     date_creation = models.DateTimeField(default=timezone.now, editable=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-date_creation', '-id'], name='pub_recent_idx'),
+            models.Index(fields=['prix', '-date_creation', '-id'], name='pub_prix_idx'),
+            models.Index(fields=['-prix', '-date_creation', '-id'], name='pub_prix_desc_idx'),
+            models.Index(fields=['-date_creation', '-id'], name='pub_dispo_recent_idx', condition=Q(est_disponible=True)),
+            models.Index(fields=['prix', '-date_creation', '-id'], name='pub_dispo_prix_idx', condition=Q(est_disponible=True)),
+            models.Index(fields=['statut_transaction', '-date_creation', '-id'], name='pub_dispo_statut_recent_idx', condition=Q(est_disponible=True)),
+            models.Index(fields=['statut_transaction', 'prix', '-date_creation', '-id'], name='pub_dispo_statut_prix_idx', condition=Q(est_disponible=True)),
+            models.Index(fields=['proprietaire', '-date_creation'], name='pub_proprietaire_recent_idx'),
+            models.Index(fields=['video'], name='pub_video_idx'),
+        ]
+
     def clean(self):
         super().clean()
         if not self.video:
             raise ValidationError({'video': 'La vidéo est obligatoire.'})
 
+    @property
+    def prechargement_video(self):
+        if self.debit is None:
+            return 'metadata'
+        if self.debit > DEBIT_PRECHARGEMENT_MAX:
+            return 'none'
+        if self.debit > DEBIT_PRECHARGEMENT_COMPLET:
+            return 'metadata'
+        return 'auto'
+
     def __str__(self):
         return self.titre
 
@@ -122,6 +174,9 @@ class Conversation(models.Model):
     proprietaire = models.ForeignKey(Utilisateur, on_delete=models.CASCADE, related_name='conversations_comme_proprietaire')
     demandeur = models.ForeignKey(Utilisateur, on_delete=models.CASCADE, related_name='conversations_comme_demandeur')
 
+    dernier_message_lu_proprietaire = models.BigIntegerField(default=0)
+    dernier_message_lu_demandeur = models.BigIntegerField(default=0)
+
     date_creation = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
@@ -142,6 +197,18 @@ class Conversation(models.Model):
             if self.publication.proprietaire_id != self.proprietaire_id:
                 raise ValidationError({'proprietaire': "Le propriétaire doit correspondre au propriétaire de la publication."})
 
+    def champ_dernier_message_lu(self, utilisateur_id):
+        if utilisateur_id == self.proprietaire_id:
+            return 'dernier_message_lu_proprietaire'
+        return 'dernier_message_lu_demandeur'
+
+    def dernier_message_lu(self, utilisateur_id):
+        return getattr(self, self.champ_dernier_message_lu(utilisateur_id))
+
+    def message_est_lu(self, message):
+        destinataire_id = self.demandeur_id if message.expediteur_id == self.proprietaire_id else self.proprietaire_id
+        return message.id <= self.dernier_message_lu(destinataire_id)
+
     def __str__(self):
         return f"{self.publication_id} - {self.demandeur_id}"
 
@@ -160,12 +227,17 @@ class Message(models.Model):
     vocal = models.FileField(upload_to='vocaux_messages/', blank=True, null=True)
 
     type_message = models.CharField(max_length=10, choices=TypeMessage.choices, default=TypeMessage.TEXTE)
-    est_lu = models.BooleanField(default=False)
 
     date_creation = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         ordering = ['date_creation']
+        indexes = [
+            models.Index(fields=['conversation', 'id'], name='msg_conversation_id_idx'),
+            # Contrôle d'accès des pièces jointes servies par servir_media.
+            models.Index(fields=['fichier'], name='msg_fichier_idx'),
+            models.Index(fields=['vocal'], name='msg_vocal_idx'),
+        ]
 
     def clean(self):
         super().clean()
@@ -189,6 +261,89 @@ class Message(models.Model):
         return f"Message {self.pk}"
 
 
+class ResumeConversation(models.Model):
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='resumes')
+    utilisateur = models.ForeignKey(Utilisateur, on_delete=models.CASCADE, related_name='resumes_conversations')
+    contact = models.ForeignKey(Utilisateur, on_delete=models.CASCADE, related_name='+')
+
+    dernier_message = models.ForeignKey(Message, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    date_derniere_activite = models.DateTimeField(default=timezone.now)
+    nombre_non_lus = models.PositiveIntegerField(default=0)
+
+    # Compteur de modifications propre à chaque utilisateur : la liste des
+    # conversations ne renvoie que les résumés plus récents que le jeton reçu.
+    version = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['conversation', 'utilisateur'],
+                name='unicite_resume_par_conversation_et_utilisateur',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['utilisateur', '-date_derniere_activite'], name='resume_activite_idx'),
+            models.Index(fields=['utilisateur', 'version'], name='resume_version_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.conversation_id} - {self.utilisateur_id}"
+
+
+class EvenementSortant(models.Model):
+    groupe = models.CharField(max_length=100)
+    donnees = models.JSONField()
+
+    tentatives = models.PositiveSmallIntegerField(default=0)
+    prochaine_tentative = models.DateTimeField(default=timezone.now)
+    jeton = models.CharField(max_length=32, blank=True, default='')
+    date_reservation = models.DateTimeField(blank=True, null=True)
+
+    date_creation = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['prochaine_tentative', 'id'], name='evenement_a_envoyer_idx'),
+            models.Index(fields=['jeton'], name='evenement_jeton_idx', condition=~Q(jeton='')),
+        ]
+
+    def __str__(self):
+        return f"{self.groupe} - {self.donnees.get('type')}"
+
+
+class TeleversementFragmente(models.Model):
+    identifiant = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    utilisateur = models.ForeignKey(Utilisateur, on_delete=models.CASCADE, related_name='televersements')
+
+    nom_fichier = models.CharField(max_length=255)
+    taille = models.PositiveBigIntegerField()
+    decalage = models.PositiveBigIntegerField(default=0)
+
+    date_creation = models.DateTimeField(default=timezone.now, editable=False)
+    date_modification = models.DateTimeField(default=timezone.now)
+
+    @property
+    def est_termine(self):
+        return self.decalage >= self.taille
+
+    def __str__(self):
+        return f"{self.nom_fichier} ({self.decalage}/{self.taille})"
+
+
+class ReferenceMedia(models.Model):
+    # Nombre de champs qui pointent vers un fichier du stockage par empreinte
+    # (immobilier.stockage) : un contenu envoyé plusieurs fois n'est stocké
+    # qu'une fois.
+    nom = models.CharField(max_length=255, unique=True)
+    references = models.PositiveIntegerField(default=1)
+    taille = models.PositiveBigIntegerField(default=0)
+
+    date_creation = models.DateTimeField(default=timezone.now, editable=False)
+
+    def __str__(self):
+        return f"{self.nom} ({self.references})"
+
+
 class Signalement(models.Model):
     publication = models.ForeignKey(Publication, on_delete=models.CASCADE, related_name='signalements')
     auteur = models.ForeignKey(Utilisateur, on_delete=models.SET_NULL, blank=True, null=True, related_name='signalements')
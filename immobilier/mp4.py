@@ -0,0 +1,198 @@
+import functools
+import io
+import os
+import struct
+from dataclasses import dataclass, replace
+
+
+# Boîtes dont le contenu est lui-même une suite de boîtes, sur le chemin qui
+# mène aux tables de positions des morceaux (stco / co64).
+CONTENEURS = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+
+TAILLE_MAX_MOOV = 64 * 1024 * 1024
+TAILLE_BLOC_COPIE = 1024 * 1024
+
+
+class FormatMP4Invalide(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Boite:
+    type: bytes
+    position: int
+    taille: int
+    taille_entete: int
+
+    @property
+    def fin(self):
+        return self.position + self.taille
+
+    @property
+    def debut_contenu(self):
+        return self.position + self.taille_entete
+
+
+@dataclass(frozen=True)
+class InfosVideo:
+    duree: float
+    largeur: int | None
+    hauteur: int | None
+    debit: int | None
+    moov_en_tete: bool
+
+
+def _signaler_format_invalide(fonction):
+    # Une table plus courte qu'annoncé se manifeste par une struct.error au
+    # décodage : on la présente comme n'importe quel autre fichier invalide.
+    @functools.wraps(fonction)
+    def enveloppe(*arguments, **options):
+        try:
+            return fonction(*arguments, **options)
+        except struct.error as erreur:
+            raise FormatMP4Invalide(str(erreur)) from erreur
+    return enveloppe
+
+
+def _boites(fichier, debut, fin):
+    position = debut
+    while position + 8 <= fin:
+        fichier.seek(position)
+        taille, type_boite = struct.unpack('>I4s', fichier.read(8))
+        taille_entete = 8
+        if taille == 1:
+            (taille,) = struct.unpack('>Q', fichier.read(8))
+            taille_entete = 16
+        elif taille == 0:
+            taille = fin - position
+        if taille < taille_entete or position + taille > fin:
+            raise FormatMP4Invalide(f"Boîte {type_boite!r} tronquée à l'octet {position}.")
+        yield Boite(type_boite, position, taille, taille_entete)
+        position += taille
+
+
+def _enfants(donnees, boite):
+    return _boites(io.BytesIO(donnees), boite.debut_contenu, boite.fin)
+
+
+def _enfant(donnees, boite, type_boite):
+    return next((b for b in _enfants(donnees, boite) if b.type == type_boite), None)
+
+
+def _structure(fichier):
+    taille_fichier = os.fstat(fichier.fileno()).st_size
+    boites = list(_boites(fichier, 0, taille_fichier))
+    moov = next((b for b in boites if b.type == b'moov'), None)
+    mdat = next((b for b in boites if b.type == b'mdat'), None)
+    if moov is None or mdat is None:
+        raise FormatMP4Invalide("Boîte moov ou mdat absente.")
+    if moov.taille > TAILLE_MAX_MOOV:
+        raise FormatMP4Invalide("Boîte moov trop volumineuse.")
+    fichier.seek(moov.position)
+    return taille_fichier, boites, moov, mdat, bytearray(fichier.read(moov.taille))
+
+
+def _duree(donnees, moov):
+    mvhd = _enfant(donnees, moov, b'mvhd')
+    if mvhd is None:
+        raise FormatMP4Invalide("Boîte mvhd absente.")
+    debut = mvhd.debut_contenu
+    if donnees[debut] == 1:
+        echelle, duree = struct.unpack_from('>IQ', donnees, debut + 20)
+    else:
+        echelle, duree = struct.unpack_from('>II', donnees, debut + 12)
+    return duree / echelle if echelle else 0.0
+
+
+def _dimensions(donnees, moov):
+    for trak in _enfants(donnees, moov):
+        if trak.type != b'trak':
+            continue
+        mdia = _enfant(donnees, trak, b'mdia')
+        hdlr = mdia and _enfant(donnees, mdia, b'hdlr')
+        if hdlr is None or donnees[hdlr.debut_contenu + 8:hdlr.debut_contenu + 12] != b'vide':
+            continue
+        tkhd = _enfant(donnees, trak, b'tkhd')
+        if tkhd is None:
+            continue
+        debut_matrice = tkhd.debut_contenu + (52 if donnees[tkhd.debut_contenu] == 1 else 40)
+        a, b = struct.unpack_from('>ii', donnees, debut_matrice)
+        largeur, hauteur = struct.unpack_from('>II', donnees, tkhd.fin - 8)
+        largeur, hauteur = largeur >> 16, hauteur >> 16
+        # Les téléphones filment en paysage et notent la rotation dans la
+        # matrice : on renvoie les dimensions telles qu'elles sont affichées.
+        if a == 0 and b != 0:
+            largeur, hauteur = hauteur, largeur
+        return largeur, hauteur
+    return None, None
+
+
+@_signaler_format_invalide
+def analyser_video(chemin):
+    with open(chemin, 'rb') as fichier:
+        taille_fichier, _, moov, mdat, donnees = _structure(fichier)
+    racine = replace(moov, position=0)
+    duree = _duree(donnees, racine)
+    largeur, hauteur = _dimensions(donnees, racine)
+    return InfosVideo(
+        duree=round(duree, 3),
+        largeur=largeur,
+        hauteur=hauteur,
+        debit=round(taille_fichier * 8 / duree) if duree > 0 else None,
+        moov_en_tete=moov.position < mdat.position,
+    )
+
+
+def _decaler_positions(donnees, boite, debut, fin, decalage):
+    for enfant in _enfants(donnees, boite):
+        if enfant.type in CONTENEURS:
+            _decaler_positions(donnees, enfant, debut, fin, decalage)
+        elif enfant.type in (b'stco', b'co64'):
+            format_position, taille_position = ('>I', 4) if enfant.type == b'stco' else ('>Q', 8)
+            (nombre,) = struct.unpack_from('>I', donnees, enfant.debut_contenu + 4)
+            position = enfant.debut_contenu + 8
+            for _ in range(nombre):
+                (valeur,) = struct.unpack_from(format_position, donnees, position)
+                if debut <= valeur < fin:
+                    valeur += decalage
+                    if enfant.type == b'stco' and valeur > 0xFFFFFFFF:
+                        raise FormatMP4Invalide("Position hors de portée d'une table stco.")
+                    struct.pack_into(format_position, donnees, position, valeur)
+                position += taille_position
+        elif enfant.type == b'cmov':
+            raise FormatMP4Invalide("Boîte moov compressée non prise en charge.")
+
+
+def _copier(source, destination, debut, taille):
+    source.seek(debut)
+    while taille > 0:
+        bloc = source.read(min(taille, TAILLE_BLOC_COPIE))
+        if not bloc:
+            raise FormatMP4Invalide("Fichier tronqué pendant la copie.")
+        destination.write(bloc)
+        taille -= len(bloc)
+
+
+@_signaler_format_invalide
+def deplacer_moov_en_tete(chemin, destination):
+    # Équivalent de qt-faststart : ftyp, puis moov, puis le reste dans l'ordre
+    # d'origine, écrits dans `destination` (fichier ouvert en écriture). La
+    # source n'est jamais modifiée ; renvoie False, sans rien écrire, si elle
+    # était déjà lisible en progressif.
+    with open(chemin, 'rb') as source:
+        _, boites, moov, mdat, donnees = _structure(source)
+        if moov.position < mdat.position:
+            return False
+
+        entete = [boite for boite in boites[:1] if boite.type == b'ftyp']
+        insertion = entete[0].fin if entete else 0
+        _decaler_positions(donnees, replace(moov, position=0), insertion, moov.position, moov.taille)
+
+        for boite in entete:
+            _copier(source, destination, boite.position, boite.taille)
+        destination.write(donnees)
+        for boite in boites:
+            if boite in entete or boite == moov:
+                continue
+            _copier(source, destination, boite.position, boite.taille)
+    return True
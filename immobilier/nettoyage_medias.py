@@ -0,0 +1,216 @@
+import logging
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import timedelta
+from itertools import islice
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+
+from .images import DOSSIER_MINIATURES, source_miniature
+from .models import ReferenceMedia, TeleversementFragmente
+from .televersements import abandonner_televersement
+
+
+journal = logging.getLogger(__name__)
+
+# Un fichier plus récent que ce délai n'est jamais supprimé : il peut être
+# en cours d'envoi, ou enregistré mais pas encore rattaché à sa ligne.
+DELAI_GRACE = timedelta(hours=24)
+TAILLE_LOT = 500
+
+SUFFIXE_TEMPORAIRE = '.tmp'
+SUFFIXE_TELEVERSEMENT = '.part'
+
+
+@dataclass
+class BilanNettoyage:
+    examines: int = 0
+    orphelins: int = 0
+    octets: int = 0
+    supprimes: int = 0
+    references_corrigees: int = 0
+    televersements_abandonnes: int = 0
+
+
+def champs_medias():
+    # (modèle, champ, dossier) pour chaque champ fichier de l'application.
+    for modele in apps.get_app_config('immobilier').get_models():
+        for champ in modele._meta.get_fields():
+            if isinstance(champ, models.FileField) and isinstance(champ.upload_to, str):
+                yield modele, champ.name, champ.upload_to
+
+
+def _parcourir(dossier, prefixe=''):
+    # Parcours paresseux : seul le dossier courant de chaque niveau est en
+    # mémoire, jamais la liste complète des fichiers.
+    try:
+        entrees = os.scandir(dossier)
+    except FileNotFoundError:
+        return
+    with entrees:
+        for entree in entrees:
+            nom = f"{prefixe}{entree.name}"
+            if entree.is_dir(follow_symlinks=False):
+                yield from _parcourir(entree.path, f"{nom}/")
+            elif entree.is_file(follow_symlinks=False):
+                yield nom, entree
+
+
+def _lots(elements, taille):
+    elements = iter(elements)
+    while lot := list(islice(elements, taille)):
+        yield lot
+
+
+def _cle_reference(nom, dossiers):
+    # Nom de fichier dont la présence en base garde `nom` en vie : lui-même,
+    # ou la photo source d'une miniature. None : fichier à ne pas toucher.
+    # Chaîne vide : orphelin quoi qu'il arrive.
+    if nom.endswith(SUFFIXE_TEMPORAIRE):
+        return ''
+    if nom.startswith(DOSSIER_MINIATURES):
+        source, _ = source_miniature(nom)
+        return source or ''
+    if nom.startswith(dossiers):
+        return nom
+    return None
+
+
+def _comptes_references(noms, champs):
+    comptes = Counter()
+    for modele, champ, dossier in champs:
+        candidats = [nom for nom in noms if nom.startswith(dossier)]
+        if candidats:
+            comptes.update(
+                modele.objects.filter(**{f"{champ}__in": candidats}).order_by().values_list(champ, flat=True)
+            )
+    return comptes
+
+
+def _est_recent(chemin, limite):
+    try:
+        return os.stat(chemin).st_mtime > limite
+    except FileNotFoundError:
+        return True
+
+
+def _supprimer(nom, chemin, cle, limite, champs):
+    # La suppression de la ligne ReferenceMedia prend le verrou d'écriture
+    # SQLite avant les dernières vérifications : un envoi du même contenu
+    # (StockageAdresseContenu._save) passe soit avant, et rafraîchit la date
+    # du fichier, soit après, et le réécrit.
+    with transaction.atomic():
+        ReferenceMedia.objects.filter(nom=nom).delete()
+        if _est_recent(chemin, limite) or (cle and _comptes_references([cle], champs)[cle]):
+            transaction.set_rollback(True)
+            return False
+        os.unlink(chemin)
+    return True
+
+
+def _corriger_references(lot, comptes, limite):
+    # Les suppressions en cascade ne passent pas par le stockage : le
+    # compteur d'un fichier partagé reste trop haut et delete() ne le
+    # retirerait jamais.
+    corrigees = 0
+    references = ReferenceMedia.objects.filter(nom__in=[nom for nom, _ in lot]).in_bulk(field_name='nom')
+    for nom, entree in lot:
+        reference = references.get(nom)
+        if reference is None or comptes[nom] in (0, reference.references):
+            continue
+        with transaction.atomic():
+            ReferenceMedia.objects.filter(pk=reference.pk).update(references=comptes[nom])
+            if _est_recent(entree.path, limite):
+                transaction.set_rollback(True)
+                continue
+        corrigees += 1
+    return corrigees
+
+
+def _nettoyer_televersements(delai, limite, simulation, bilan, rapporter):
+    date_limite = timezone.now() - delai
+    for televersement in TeleversementFragmente.objects.filter(date_modification__lt=date_limite).iterator():
+        bilan.televersements_abandonnes += 1
+        if rapporter:
+            rapporter(f"televersements/{televersement.identifiant.hex}{SUFFIXE_TELEVERSEMENT}", televersement.decalage)
+        if not simulation:
+            abandonner_televersement(televersement)
+
+    # Fichiers .part dont la ligne a disparu (utilisateur supprimé).
+    fichiers = (
+        (nom, entree) for nom, entree in _parcourir(settings.DOSSIER_TELEVERSEMENTS)
+        if nom.endswith(SUFFIXE_TELEVERSEMENT) and entree.stat().st_mtime <= limite
+    )
+    for lot in _lots(fichiers, TAILLE_LOT):
+        identifiants = {nom.removesuffix(SUFFIXE_TELEVERSEMENT): entree for nom, entree in lot}
+        connus = {
+            identifiant.hex for identifiant in
+            TeleversementFragmente.objects.filter(identifiant__in=list(identifiants)).values_list('identifiant', flat=True)
+        }
+        for identifiant, entree in identifiants.items():
+            if identifiant in connus:
+                continue
+            bilan.orphelins += 1
+            bilan.octets += entree.stat().st_size
+            if rapporter:
+                rapporter(f"televersements/{entree.name}", entree.stat().st_size)
+            if not simulation:
+                Path(entree.path).unlink(missing_ok=True)
+                bilan.supprimes += 1
+
+
+def nettoyer_medias(delai=DELAI_GRACE, simulation=True, rapporter=None):
+    # Parcourt MEDIA_ROOT par lots de TAILLE_LOT fichiers et retire ceux
+    # qu'aucune ligne ne référence plus : médias des publications, messages
+    # et utilisateurs supprimés, anciennes photos de profil, miniatures de
+    # ces photos et fichiers temporaires abandonnés. En simulation, rien
+    # n'est modifié ; `rapporter(nom, taille)` reçoit chaque orphelin.
+    limite = time.time() - delai.total_seconds()
+    champs = list(champs_medias())
+    dossiers = tuple(dossier for _, _, dossier in champs)
+    bilan = BilanNettoyage()
+
+    for lot in _lots(_parcourir(settings.MEDIA_ROOT), TAILLE_LOT):
+        bilan.examines += len(lot)
+        candidats = []
+        for nom, entree in lot:
+            cle = _cle_reference(nom, dossiers)
+            if cle is not None and entree.stat().st_mtime <= limite:
+                candidats.append((nom, entree, cle))
+
+        comptes = _comptes_references([cle for _, _, cle in candidats if cle], champs)
+        for nom, entree, cle in candidats:
+            if cle and comptes[cle]:
+                continue
+            taille = entree.stat().st_size
+            bilan.orphelins += 1
+            bilan.octets += taille
+            if rapporter:
+                rapporter(nom, taille)
+            if not simulation and _supprimer(nom, entree.path, cle, limite, champs):
+                bilan.supprimes += 1
+
+        referencees = [(nom, entree) for nom, entree, cle in candidats if cle == nom and comptes[cle]]
+        if referencees:
+            if simulation:
+                bilan.references_corrigees += sum(
+                    1 for nom, reference in ReferenceMedia.objects.filter(nom__in=[nom for nom, _ in referencees]).values_list('nom', 'references')
+                    if reference != comptes[nom]
+                )
+            else:
+                bilan.references_corrigees += _corriger_references(referencees, comptes, limite)
+
+    _nettoyer_televersements(delai, limite, simulation, bilan, rapporter)
+
+    if not simulation and (bilan.supprimes or bilan.televersements_abandonnes):
+        journal.info(
+            "Nettoyage des médias : %s fichier(s) supprimé(s), %s octet(s) libéré(s), %s téléversement(s) abandonné(s).",
+            bilan.supprimes, bilan.octets, bilan.televersements_abandonnes,
+        )
+    return bilan
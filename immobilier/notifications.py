@@ -0,0 +1,93 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+
+from .boite_envoi import enregistrer_evenements
+from .models import Message
+from .serialisation import serialiser_message
+
+
+journal = logging.getLogger(__name__)
+
+CLE_DERNIER_MESSAGE = 'conversation_dernier_message:{}'
+DUREE_CACHE_DERNIER_MESSAGE = 24 * 60 * 60
+
+DELAI_ATTENTE_MAX = 20
+INTERVALLE_VERIFICATION = 1
+
+# Par processus ; voir ATTENTES_MESSAGES_PAR_PROCESSUS dans les réglages.
+NOMBRE_MAX_ATTENTES = settings.ATTENTES_MESSAGES_PAR_PROCESSUS
+
+_condition = threading.Condition()
+_places_attente = threading.BoundedSemaphore(NOMBRE_MAX_ATTENTES)
+
+
+def dernier_message_signale(conversation_id):
+    return cache.get(CLE_DERNIER_MESSAGE.format(conversation_id))
+
+
+def dernier_message_connu(conversation_id):
+    dernier = dernier_message_signale(conversation_id)
+    if dernier is None:
+        dernier = Message.objects.filter(conversation_id=conversation_id).aggregate(dernier=models.Max('id'))['dernier'] or 0
+        # add() et non set() : un signalement plus récent a pu passer entre-temps.
+        cache.add(CLE_DERNIER_MESSAGE.format(conversation_id), dernier, DUREE_CACHE_DERNIER_MESSAGE)
+    return dernier
+
+
+def _reveiller():
+    with _condition:
+        _condition.notify_all()
+
+
+def signaler_message(message):
+    conversation = message.conversation
+    message_json = serialiser_message(message, message.expediteur_id, conversation)
+    activite = {'type': 'conversation_activite', 'conversation_id': conversation.id, 'message': message_json}
+    enregistrer_evenements([
+        (f"conversation_{conversation.id}", {'type': 'message_nouveau', 'message': message_json}),
+        (f"utilisateur_{conversation.proprietaire_id}", activite),
+        (f"utilisateur_{conversation.demandeur_id}", activite),
+    ])
+
+    def signaler():
+        cache.set(CLE_DERNIER_MESSAGE.format(message.conversation_id), message.id, DUREE_CACHE_DERNIER_MESSAGE)
+        _reveiller()
+
+    transaction.on_commit(signaler)
+
+
+def signaler_lecture(conversation, utilisateur_id):
+    enregistrer_evenements([
+        (f"utilisateur_{utilisateur_id}", {'type': 'conversation_activite', 'conversation_id': conversation.id}),
+    ])
+
+
+# True dès qu'un message plus récent que depuis_id est signalé, False à
+# l'expiration du délai, None si toutes les places d'attente sont prises. Les
+# messages écrits dans ce processus réveillent l'attente aussitôt ; ceux de
+# l'autre worker sont vus via le cache partagé à chaque vérification.
+def attendre_message(conversation_id, depuis_id, delai=DELAI_ATTENTE_MAX):
+    if not _places_attente.acquire(blocking=False):
+        journal.info("%s attentes en cours, conversation %s renvoyée au polling", NOMBRE_MAX_ATTENTES, conversation_id)
+        return None
+
+    try:
+        echeance = time.monotonic() + delai
+        while True:
+            dernier = dernier_message_signale(conversation_id)
+            if dernier is not None and dernier > depuis_id:
+                return True
+
+            restant = echeance - time.monotonic()
+            if restant <= 0:
+                return False
+
+            with _condition:
+                _condition.wait(min(restant, INTERVALLE_VERIFICATION))
+    finally:
+        _places_attente.release()
@@ -0,0 +1,128 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core import signing
+from django.db.models import Q
+
+
+SEL_CURSEUR = 'immobilier.pagination.curseur'
+
+SENS_SUIVANT = 's'
+SENS_PRECEDENT = 'p'
+
+
+class PageCurseur:
+    def __init__(self, object_list, curseur_suivant=None, curseur_precedent=None):
+        self.object_list = object_list
+        self.curseur_suivant = curseur_suivant
+        self.curseur_precedent = curseur_precedent
+
+    @property
+    def has_next(self):
+        return self.curseur_suivant is not None
+
+    @property
+    def has_previous(self):
+        return self.curseur_precedent is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _inverser_ordre(ordre):
+    return [cle[1:] if cle.startswith('-') else f"-{cle}" for cle in ordre]
+
+
+def _valeur_serialisable(valeur):
+    if isinstance(valeur, (datetime, date)):
+        return valeur.isoformat()
+    if isinstance(valeur, Decimal):
+        return str(valeur)
+    return valeur
+
+
+def encoder_curseur(ordre, valeurs, sens):
+    return signing.dumps(
+        {'o': list(ordre), 'v': [_valeur_serialisable(v) for v in valeurs], 's': sens},
+        salt=SEL_CURSEUR,
+        compress=True,
+    )
+
+
+def decoder_curseur(curseur, ordre):
+    curseur = (curseur or '').strip()
+    if not curseur:
+        return None, SENS_SUIVANT
+
+    try:
+        donnees = signing.loads(curseur, salt=SEL_CURSEUR)
+    except signing.BadSignature:
+        return None, SENS_SUIVANT
+
+    if not isinstance(donnees, dict) or donnees.get('o') != list(ordre):
+        return None, SENS_SUIVANT
+
+    valeurs = donnees.get('v')
+    sens = donnees.get('s')
+    if not isinstance(valeurs, list) or len(valeurs) != len(ordre) or sens not in [SENS_SUIVANT, SENS_PRECEDENT]:
+        return None, SENS_SUIVANT
+
+    return valeurs, sens
+
+
+def filtre_apres(ordre, valeurs):
+    condition = Q()
+    egalites = {}
+    for cle, valeur in zip(ordre, valeurs):
+        champ = cle.lstrip('-')
+        comparaison = 'lt' if cle.startswith('-') else 'gt'
+        condition |= Q(**egalites, **{f"{champ}__{comparaison}": valeur})
+        egalites[champ] = valeur
+
+    # Borne redondante sur la première clé : sans elle, SQLite éclate le OR
+    # en plusieurs recherches d'index puis trie, au lieu de parcourir l'index
+    # dans l'ordre à partir du curseur.
+    premiere_cle = ordre[0]
+    borne = 'lte' if premiere_cle.startswith('-') else 'gte'
+    return Q(**{f"{premiere_cle.lstrip('-')}__{borne}": valeurs[0]}) & condition
+
+
+def _valeurs_cle(objet, ordre):
+    return [getattr(objet, cle.lstrip('-')) for cle in ordre]
+
+
+def paginer_par_curseur(queryset, ordre, curseur, taille):
+    valeurs, sens = decoder_curseur(curseur, ordre)
+
+    ordre_requete = _inverser_ordre(ordre) if sens == SENS_PRECEDENT else list(ordre)
+    queryset = queryset.order_by(*ordre_requete)
+    if valeurs is not None:
+        queryset = queryset.filter(filtre_apres(ordre_requete, valeurs))
+
+    elements = list(queryset[:taille + 1])
+    a_encore = len(elements) > taille
+    elements = elements[:taille]
+
+    if sens == SENS_PRECEDENT:
+        elements.reverse()
+        a_suivant = valeurs is not None
+        a_precedent = a_encore
+    else:
+        a_suivant = a_encore
+        a_precedent = valeurs is not None
+
+    curseur_suivant = None
+    curseur_precedent = None
+    if elements and a_suivant:
+        curseur_suivant = encoder_curseur(ordre, _valeurs_cle(elements[-1], ordre), SENS_SUIVANT)
+    if elements and a_precedent:
+        curseur_precedent = encoder_curseur(ordre, _valeurs_cle(elements[0], ordre), SENS_PRECEDENT)
+
+    return PageCurseur(elements, curseur_suivant, curseur_precedent)
@@ -0,0 +1,44 @@
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Conversation
+
+
+CLE_PARTICIPANTS = 'conversation_participants:{}'
+DUREE_PARTICIPANTS = 300
+
+
+# Les participants d'une conversation ne changent jamais après sa création :
+# seule la suppression invalide l'entrée. Elle vit dans le cache partagé
+# (CACHES) et non dans chaque processus, pour que la suppression soit vue
+# aussitôt par tous les workers et consommateurs websocket.
+def participants_conversation(conversation_id):
+    cle = CLE_PARTICIPANTS.format(conversation_id)
+    participants = cache.get(cle)
+    if participants is None:
+        participants = (
+            Conversation.objects
+            .filter(pk=conversation_id)
+            .values_list('proprietaire_id', 'demandeur_id')
+            .first()
+        )
+        if participants is not None:
+            cache.set(cle, participants, DUREE_PARTICIPANTS)
+    return participants
+
+
+def est_participant(conversation_id, utilisateur_id):
+    participants = participants_conversation(conversation_id)
+    return participants is not None and utilisateur_id in participants
+
+
+def memoriser_participants(conversation):
+    cache.set(CLE_PARTICIPANTS.format(conversation.id), (conversation.proprietaire_id, conversation.demandeur_id), DUREE_PARTICIPANTS)
+
+
+def oublier_conversation(conversation_id):
+    # Après le COMMIT aussi : une lecture faite entre la suppression et la
+    # validation remettrait sinon l'entrée en cache.
+    cle = CLE_PARTICIPANTS.format(conversation_id)
+    cache.delete(cle)
+    transaction.on_commit(lambda: cache.delete(cle))
@@ -0,0 +1,121 @@
+import re
+
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
+
+
+TABLE_RECHERCHE = 'immobilier_publication_fts'
+
+COLONNES_RECHERCHE = ['titre', 'description', 'avenue', 'quartier', 'commune']
+
+# Les triggers recopient la publication et son adresse dans la table FTS5 à
+# chaque insertion, modification ou suppression, y compris via
+# QuerySet.update() ou l'administration.
+SQL_CREATION = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE_RECHERCHE} USING fts5(
+        {', '.join(COLONNES_RECHERCHE)},
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3 4'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE_RECHERCHE}_insertion
+    AFTER INSERT ON immobilier_publication BEGIN
+        INSERT INTO {TABLE_RECHERCHE} (rowid, {', '.join(COLONNES_RECHERCHE)})
+        SELECT new.id, new.titre, new.description, a.avenue, a.quartier, a.commune
+        FROM immobilier_adresse a WHERE a.id = new.adresse_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE_RECHERCHE}_modification
+    AFTER UPDATE OF titre, description, adresse_id ON immobilier_publication BEGIN
+        DELETE FROM {TABLE_RECHERCHE} WHERE rowid = old.id;
+        INSERT INTO {TABLE_RECHERCHE} (rowid, {', '.join(COLONNES_RECHERCHE)})
+        SELECT new.id, new.titre, new.description, a.avenue, a.quartier, a.commune
+        FROM immobilier_adresse a WHERE a.id = new.adresse_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE_RECHERCHE}_suppression
+    AFTER DELETE ON immobilier_publication BEGIN
+        DELETE FROM {TABLE_RECHERCHE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE_RECHERCHE}_adresse
+    AFTER UPDATE OF avenue, quartier, commune ON immobilier_adresse BEGIN
+        UPDATE {TABLE_RECHERCHE}
+        SET avenue = new.avenue, quartier = new.quartier, commune = new.commune
+        WHERE rowid IN (SELECT id FROM immobilier_publication WHERE adresse_id = new.id);
+    END
+    """,
+]
+
+SQL_REMPLISSAGE = f"""
+    INSERT INTO {TABLE_RECHERCHE} (rowid, {', '.join(COLONNES_RECHERCHE)})
+    SELECT p.id, p.titre, p.description, a.avenue, a.quartier, a.commune
+    FROM immobilier_publication p JOIN immobilier_adresse a ON a.id = p.adresse_id
+"""
+
+SQL_SUPPRESSION = [
+    f"DROP TRIGGER IF EXISTS {TABLE_RECHERCHE}_insertion",
+    f"DROP TRIGGER IF EXISTS {TABLE_RECHERCHE}_modification",
+    f"DROP TRIGGER IF EXISTS {TABLE_RECHERCHE}_suppression",
+    f"DROP TRIGGER IF EXISTS {TABLE_RECHERCHE}_adresse",
+    f"DROP TABLE IF EXISTS {TABLE_RECHERCHE}",
+]
+
+
+def recherche_disponible(connexion=None):
+    return (connexion or connection).vendor == 'sqlite'
+
+
+def reconstruire_index_recherche(connexion=None):
+    connexion = connexion or connection
+    if not recherche_disponible(connexion):
+        return
+    with connexion.cursor() as curseur:
+        for sql in SQL_SUPPRESSION + SQL_CREATION:
+            curseur.execute(sql)
+        curseur.execute(SQL_REMPLISSAGE)
+
+
+def expression_recherche(texte, colonne=None):
+    jetons = re.findall(r'\w+', texte or '')
+    if not jetons:
+        return ''
+    termes = ' '.join(f'"{jeton}"*' for jeton in jetons)
+    if colonne:
+        return f"{colonne} : ({termes})"
+    return f"({termes})"
+
+
+def filtrer_par_texte(publications, texte='', quartier='', commune=''):
+    if not recherche_disponible():
+        for champ, valeur in [('titre', texte), ('adresse__quartier', quartier), ('adresse__commune', commune)]:
+            if valeur:
+                publications = publications.filter(**{f"{champ}__icontains": valeur})
+        return publications, False
+
+    expression = ' AND '.join(
+        e for e in [
+            expression_recherche(texte),
+            expression_recherche(quartier, 'quartier'),
+            expression_recherche(commune, 'commune'),
+        ] if e
+    )
+    if not expression:
+        return publications, False
+
+    table_publication = publications.model._meta.db_table
+    publications = publications.filter(
+        id__in=RawSQL(f"SELECT rowid FROM {TABLE_RECHERCHE} WHERE {TABLE_RECHERCHE} MATCH %s", (expression,))
+    ).annotate(
+        pertinence=RawSQL(
+            f"SELECT rank FROM {TABLE_RECHERCHE} WHERE {TABLE_RECHERCHE} MATCH %s AND rowid = {table_publication}.id",
+            (expression,),
+            output_field=models.FloatField(),
+        )
+    )
+    return publications, True
@@ -1,8 +1,9 @@
 from django.urls import re_path
 
-from .consommateurs import ConsommateurConversation
+from .consommateurs import ConsommateurConversation, ConsommateurUtilisateur
 
 
 urlpatterns = [
+    re_path(r'^ws/messages/$', ConsommateurUtilisateur.as_asgi()),
     re_path(r'^ws/messages/conversation/(?P<identifiant_conversation>\d+)/$', ConsommateurConversation.as_asgi()),
 ]
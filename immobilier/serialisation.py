@@ -0,0 +1,132 @@
+import msgpack
+import ujson
+from django.core.files.storage import FileSystemStorage
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.encoding import filepath_to_uri
+
+from .images import TAILLE_AVATAR, nom_miniature
+
+
+TYPE_MSGPACK = 'application/msgpack'
+TYPE_JSON = 'application/json'
+
+TAILLE_BLOC_FLUX = 16 * 1024
+
+
+class ResolveurUrls:
+    # Résout la base d'URL une seule fois par stockage pour tout un lot, au
+    # lieu de repasser par Storage.url() pour chaque fichier.
+
+    def __init__(self):
+        self._bases = {}
+
+    def _url(self, stockage, nom):
+        if not isinstance(stockage, FileSystemStorage):
+            return stockage.url(nom)
+        base = self._bases.get(id(stockage))
+        if base is None:
+            base = self._bases[id(stockage)] = stockage.base_url
+        return base + filepath_to_uri(nom).lstrip('/')
+
+    def url(self, fichier):
+        if not fichier:
+            return None
+        return self._url(fichier.storage, fichier.name)
+
+    def miniature(self, fichier, taille):
+        if not fichier:
+            return None
+        return self._url(fichier.storage, nom_miniature(fichier.name, taille))
+
+
+def serialiser_message(message, utilisateur_id, conversation=None, urls=None):
+    urls = urls or ResolveurUrls()
+    return {
+        'id': message.id,
+        'expediteur_id': message.expediteur_id,
+        'est_moi': message.expediteur_id == utilisateur_id,
+        'contenu': message.contenu,
+        'fichier_url': urls.url(message.fichier),
+        'vocal_url': urls.url(getattr(message, 'vocal', None)),
+        'type_message': getattr(message, 'type_message', 'TEXTE'),
+        'est_lu': conversation.message_est_lu(message) if conversation else False,
+        'date_creation': message.date_creation.isoformat(),
+    }
+
+
+def serialiser_resume(resume, urls=None):
+    urls = urls or ResolveurUrls()
+    contact = resume.contact
+    dernier = resume.dernier_message
+    return {
+        'conversation_id': resume.conversation_id,
+        'publication_id': resume.conversation.publication_id,
+        'contact_id': contact.id,
+        'contact_nom_utilisateur': contact.nom_utilisateur,
+        'contact_photo_url': urls.miniature(contact.photo, TAILLE_AVATAR),
+        'dernier_message': serialiser_message(dernier, resume.utilisateur_id, resume.conversation, urls) if dernier else None,
+        'nombre_non_lus': resume.nombre_non_lus,
+    }
+
+
+def accepte_msgpack(request):
+    return TYPE_MSGPACK in request.headers.get('Accept', '')
+
+
+def _encoder_json(valeur):
+    return ujson.dumps(valeur, ensure_ascii=False, escape_forward_slashes=False)
+
+
+def _par_blocs(morceaux):
+    tampon = []
+    taille = 0
+    for morceau in morceaux:
+        tampon.append(morceau)
+        taille += len(morceau)
+        if taille >= TAILLE_BLOC_FLUX:
+            yield tampon[0][:0].join(tampon)
+            tampon = []
+            taille = 0
+    if tampon:
+        yield tampon[0][:0].join(tampon)
+
+
+def reponse_serialisee(request, donnees, status=200):
+    if accepte_msgpack(request):
+        reponse = HttpResponse(msgpack.packb(donnees, use_bin_type=True), content_type=TYPE_MSGPACK, status=status)
+    else:
+        reponse = HttpResponse(_encoder_json(donnees), content_type=TYPE_JSON, status=status)
+    patch_vary_headers(reponse, ['Accept'])
+    return reponse
+
+
+def reponse_liste(request, cle, objets, serialiser, **supplements):
+    objets = list(objets)
+
+    if accepte_msgpack(request):
+        def morceaux():
+            empaqueteur = msgpack.Packer(use_bin_type=True)
+            yield empaqueteur.pack_map_header(1 + len(supplements))
+            yield empaqueteur.pack(cle)
+            yield empaqueteur.pack_array_header(len(objets))
+            for objet in objets:
+                yield empaqueteur.pack(serialiser(objet))
+            for nom, valeur in supplements.items():
+                yield empaqueteur.pack(nom)
+                yield empaqueteur.pack(valeur)
+        type_contenu = TYPE_MSGPACK
+    else:
+        def morceaux():
+            yield f"{{{_encoder_json(cle)}:["
+            for position, objet in enumerate(objets):
+                yield (',' if position else '') + _encoder_json(serialiser(objet))
+            yield ']'
+            for nom, valeur in supplements.items():
+                yield f",{_encoder_json(nom)}:{_encoder_json(valeur)}"
+            yield '}'
+        type_contenu = TYPE_JSON
+
+    reponse = StreamingHttpResponse(_par_blocs(morceaux()), content_type=type_contenu)
+    patch_vary_headers(reponse, ['Accept'])
+    return reponse
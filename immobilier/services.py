@@ -1,6 +1,16 @@
+import os
+import tempfile
+
+from django.core.cache import cache
+from django.db import models, transaction
 from django.utils.text import slugify
 
-from .models import Utilisateur
+from .base_donnees import avec_reprise
+from .cache_lectures import ESPACE_PUBLICATION, invalider, invalider_publications
+from .models import Conversation, Message, Publication, ResumeConversation, Utilisateur
+from .mp4 import FormatMP4Invalide, analyser_video, deplacer_moov_en_tete
+from .notifications import signaler_lecture, signaler_message
+from .televersements import FichierAssemble
 
 
 def generer_propositions_noms_utilisateur(prenom, nom, poste_nom, nombre=5):
@@ -21,3 +31,276 @@ def generer_propositions_noms_utilisateur(prenom, nom, poste_nom, nombre=5):
         suffixe += 1
 
     return propositions
+
+
+CLE_CACHE_NON_LUS = 'messages_non_lus:{}'
+DUREE_CACHE_NON_LUS = 300
+
+
+def total_non_lus(utilisateur_id):
+    cle = CLE_CACHE_NON_LUS.format(utilisateur_id)
+    total = cache.get(cle)
+    if total is None:
+        total = (
+            ResumeConversation.objects
+            .filter(utilisateur_id=utilisateur_id)
+            .aggregate(total=models.Sum('nombre_non_lus'))['total']
+        ) or 0
+        cache.set(cle, total, DUREE_CACHE_NON_LUS)
+    return total
+
+
+def invalider_total_non_lus(*utilisateurs_ids):
+    cles = [CLE_CACHE_NON_LUS.format(i) for i in utilisateurs_ids]
+    transaction.on_commit(lambda: cache.delete_many(cles))
+
+
+def _compter_non_lus(conversation, utilisateur_id):
+    return (
+        Message.objects
+        .filter(conversation=conversation, id__gt=conversation.dernier_message_lu(utilisateur_id))
+        .exclude(expediteur_id=utilisateur_id)
+        .count()
+    )
+
+
+def version_conversations(utilisateur_id):
+    # (version courante, version de la dernière suppression).
+    return (
+        Utilisateur.objects
+        .filter(pk=utilisateur_id)
+        .values_list('version_conversations', 'version_suppression_conversations')
+        .first()
+    ) or (0, 0)
+
+
+def incrementer_version_conversations(*utilisateurs_ids, suppression=False):
+    # Les deux membres de l'UPDATE lisent l'ancienne valeur : la version de
+    # suppression devient la nouvelle version courante.
+    champs = {'version_conversations': models.F('version_conversations') + 1}
+    if suppression:
+        champs['version_suppression_conversations'] = models.F('version_conversations') + 1
+    Utilisateur.objects.filter(pk__in=utilisateurs_ids).update(**champs)
+
+
+def _version_courante():
+    return models.Subquery(
+        Utilisateur.objects
+        .filter(pk=models.OuterRef('utilisateur_id'))
+        .values('version_conversations')[:1]
+    )
+
+
+def recalculer_resumes_conversation(conversation):
+    messages = Message.objects.filter(conversation=conversation)
+    dernier = messages.order_by('-id').first()
+    participants = [
+        (conversation.proprietaire_id, conversation.demandeur_id),
+        (conversation.demandeur_id, conversation.proprietaire_id),
+    ]
+    with transaction.atomic():
+        incrementer_version_conversations(conversation.proprietaire_id, conversation.demandeur_id)
+        for utilisateur_id, contact_id in participants:
+            ResumeConversation.objects.update_or_create(
+                conversation=conversation,
+                utilisateur_id=utilisateur_id,
+                defaults={
+                    'contact_id': contact_id,
+                    'dernier_message': dernier,
+                    'date_derniere_activite': dernier.date_creation if dernier else conversation.date_creation,
+                    'nombre_non_lus': _compter_non_lus(conversation, utilisateur_id),
+                    'version': version_conversations(utilisateur_id)[0],
+                },
+            )
+    invalider_total_non_lus(conversation.proprietaire_id, conversation.demandeur_id)
+
+
+@avec_reprise
+def enregistrer_message(message):
+    with transaction.atomic():
+        message.save()
+        conversation = message.conversation
+        incrementer_version_conversations(conversation.proprietaire_id, conversation.demandeur_id)
+
+        resumes = ResumeConversation.objects.filter(conversation_id=message.conversation_id)
+        mis_a_jour = resumes.filter(utilisateur_id=message.expediteur_id).update(
+            dernier_message=message,
+            date_derniere_activite=message.date_creation,
+            version=_version_courante(),
+        )
+        mis_a_jour += resumes.exclude(utilisateur_id=message.expediteur_id).update(
+            dernier_message=message,
+            date_derniere_activite=message.date_creation,
+            nombre_non_lus=models.F('nombre_non_lus') + 1,
+            version=_version_courante(),
+        )
+        if mis_a_jour < 2:
+            recalculer_resumes_conversation(conversation)
+
+        if message.expediteur_id == conversation.proprietaire_id:
+            invalider_total_non_lus(conversation.demandeur_id)
+        else:
+            invalider_total_non_lus(conversation.proprietaire_id)
+
+        signaler_message(message)
+
+    return message
+
+
+@avec_reprise
+def marquer_conversation_lue(conversation, utilisateur, jusqu_a=None):
+    dernier_id = (
+        ResumeConversation.objects
+        .filter(conversation=conversation, utilisateur=utilisateur)
+        .values_list('dernier_message_id', flat=True)
+        .first()
+    )
+    if not dernier_id:
+        return False
+
+    cible = min(jusqu_a, dernier_id) if jusqu_a else dernier_id
+    champ = conversation.champ_dernier_message_lu(utilisateur.id)
+    if getattr(conversation, champ) >= cible:
+        return False
+
+    with transaction.atomic():
+        mis_a_jour = (
+            Conversation.objects
+            .filter(pk=conversation.pk, **{f"{champ}__lt": cible})
+            .update(**{champ: cible})
+        )
+        if not mis_a_jour:
+            return False
+
+        setattr(conversation, champ, cible)
+        incrementer_version_conversations(utilisateur.id)
+        ResumeConversation.objects.filter(conversation=conversation, utilisateur=utilisateur).update(
+            nombre_non_lus=_compter_non_lus(conversation, utilisateur.id),
+            version=_version_courante(),
+        )
+        invalider_total_non_lus(utilisateur.id)
+        signaler_lecture(conversation, utilisateur.id)
+
+    return True
+
+
+def _fichier_temporaire(stockage):
+    # Dans le dossier du stockage : le fichier y est ensuite renommé, jamais
+    # recopié.
+    os.makedirs(stockage.location, exist_ok=True)
+    descripteur, chemin = tempfile.mkstemp(dir=stockage.location, suffix='.mp4.tmp')
+    return os.fdopen(descripteur, 'w+b'), chemin
+
+
+def _version_progressive(chemin, stockage):
+    # Chemin d'une copie lisible en progressif, ou None si la vidéo l'est
+    # déjà ou n'est pas un MP4 lisible.
+    destination, chemin_destination = _fichier_temporaire(stockage)
+    try:
+        with destination:
+            reecrite = deplacer_moov_en_tete(chemin, destination)
+    except (OSError, FormatMP4Invalide):
+        reecrite = False
+    if not reecrite:
+        os.unlink(chemin_destination)
+        return None
+    return chemin_destination
+
+
+def _analyser(chemin):
+    try:
+        return analyser_video(chemin)
+    except (OSError, FormatMP4Invalide):
+        return None
+
+
+def _appliquer_infos(publication, infos):
+    if infos is None:
+        return None
+    champs = {
+        'duree': infos.duree,
+        'largeur': infos.largeur,
+        'hauteur': infos.hauteur,
+        'debit': infos.debit,
+    }
+    for champ, valeur in champs.items():
+        setattr(publication, champ, valeur)
+    if publication.pk:
+        Publication.objects.filter(pk=publication.pk).update(**champs)
+        invalider(ESPACE_PUBLICATION.format(publication.pk))
+    return infos
+
+
+def preparer_video(publication):
+    # Pour une vidéo déjà stockée. Hors transaction : réécrire une vidéo de
+    # plusieurs dizaines de Mo ne doit pas bloquer les autres écritures
+    # SQLite. Le fichier stocké n'est jamais modifié (son nom est l'empreinte
+    # de son contenu, d'autres publications peuvent le partager) : la version
+    # progressive est stockée comme un nouveau contenu, la publication y est
+    # rattachée et l'ancienne référence rendue.
+    video = publication.video
+    progressive = _version_progressive(video.path, video.storage)
+    if progressive is None:
+        return _appliquer_infos(publication, _analyser(video.path))
+
+    infos = _analyser(progressive)
+    ancien = video.name
+    try:
+        with FichierAssemble(open(progressive, 'rb'), name=ancien) as contenu:
+            nouveau = video.storage.save(video.field.generate_filename(publication, os.path.basename(ancien)), contenu)
+    finally:
+        try:
+            os.unlink(progressive)
+        except FileNotFoundError:
+            pass
+
+    # Seulement si la vidéo n'a pas changé entre-temps.
+    if Publication.objects.filter(pk=publication.pk, video=ancien).update(video=nouveau):
+        video.storage.delete(ancien)
+        video.name = nouveau
+        invalider_publications(Publication.objects.filter(pk=publication.pk).values_list('id', 'proprietaire__nom_utilisateur'))
+    else:
+        video.storage.delete(nouveau)
+    return _appliquer_infos(publication, infos)
+
+
+def deposer_video(publication):
+    # Écrit la vidéo envoyée dans le stockage avant l'INSERT : save() ne fait
+    # plus ensuite que des écritures de lignes, sans copie de fichier. Le moov
+    # est placé en tête avant le stockage, qui nomme le fichier d'après
+    # l'empreinte de ce contenu final ; le fichier reçu n'est jamais modifié.
+    video = publication.video
+    contenu = video.file
+    temporaires = []
+    try:
+        if hasattr(contenu, 'temporary_file_path'):
+            chemin = contenu.temporary_file_path()
+        else:
+            copie, chemin = _fichier_temporaire(video.storage)
+            temporaires.append(chemin)
+            with copie:
+                for bloc in contenu.chunks():
+                    copie.write(bloc)
+
+        progressive = _version_progressive(chemin, video.storage)
+        if progressive is not None:
+            temporaires.append(progressive)
+            chemin = progressive
+        infos = _analyser(chemin)
+
+        a_stocker = FichierAssemble(open(chemin, 'rb'), name=video.name) if temporaires else contenu
+        with a_stocker:
+            video.save(video.name, a_stocker, save=False)
+    finally:
+        contenu.close()
+        for temporaire in temporaires:
+            try:
+                os.unlink(temporaire)
+            except FileNotFoundError:
+                pass
+    _appliquer_infos(publication, infos)
+
+
+def retirer_video(publication):
+    if publication.video:
+        publication.video.delete(save=False)
@@ -0,0 +1,45 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache_lectures import ESPACE_LIEUX, ESPACE_PROFIL, invalider, invalider_publications
+from .models import Adresse, Conversation, Publication, Utilisateur
+from .participants import oublier_conversation
+from .services import incrementer_version_conversations
+
+
+@receiver(post_delete, sender=Conversation)
+def oublier_participants_conversation(sender, instance, **kwargs):
+    oublier_conversation(instance.id)
+
+
+@receiver(post_delete, sender=Conversation)
+def signaler_suppression_conversation(sender, instance, **kwargs):
+    # Un delta ne peut pas décrire une conversation disparue : les clients
+    # plus anciens que cette version rechargent la liste entière.
+    incrementer_version_conversations(instance.proprietaire_id, instance.demandeur_id, suppression=True)
+
+
+@receiver(post_save, sender=Publication)
+@receiver(post_delete, sender=Publication)
+def invalider_cache_publication(sender, instance, **kwargs):
+    nom_utilisateur = Utilisateur.objects.filter(pk=instance.proprietaire_id).values_list('nom_utilisateur', flat=True).first()
+    invalider_publications([(instance.pk, nom_utilisateur)])
+
+
+@receiver(post_save, sender=Adresse)
+@receiver(post_delete, sender=Adresse)
+def invalider_cache_adresse(sender, instance, **kwargs):
+    invalider(ESPACE_LIEUX)
+    invalider_publications(Publication.objects.filter(adresse_id=instance.pk).values_list('id', 'proprietaire__nom_utilisateur'))
+
+
+@receiver(post_save, sender=Utilisateur)
+@receiver(post_delete, sender=Utilisateur)
+def invalider_cache_utilisateur(sender, instance, update_fields=None, **kwargs):
+    # La connexion ne met à jour que last_login, absent des pages en cache.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalider(ESPACE_PROFIL.format(instance.nom_utilisateur))
+    invalider_publications(
+        (identifiant, None) for identifiant in Publication.objects.filter(proprietaire_id=instance.pk).values_list('id', flat=True)
+    )
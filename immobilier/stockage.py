@@ -0,0 +1,110 @@
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
+from django.utils.deconstruct import deconstructible
+
+
+TAILLE_BLOC_EMPREINTE = 1024 * 1024
+
+MOTIF_EXTENSION = re.compile(r'^\.[a-z0-9]{1,8}$')
+
+
+@deconstructible(path='immobilier.stockage.StockageAdresseContenu')
+class StockageAdresseContenu(FileSystemStorage):
+    # Chaque fichier est rangé sous l'empreinte SHA-256 de son contenu, dans
+    # son dossier d'origine (upload_to) découpé en deux niveaux :
+    # videos_publications/ab/cd/abcd….mp4. Un contenu déjà présent n'est pas
+    # réécrit ; ReferenceMedia compte ses utilisateurs et delete() ne retire
+    # le fichier qu'au dernier.
+
+    def get_available_name(self, name, max_length=None):
+        # Le nom définitif dépend du contenu : il est choisi dans _save().
+        return name
+
+    def nom_pour_empreinte(self, name, empreinte):
+        dossier = posixpath.dirname(name.replace('\\', '/'))
+        extension = os.path.splitext(name)[1].lower()
+        if not MOTIF_EXTENSION.match(extension):
+            extension = ''
+        return posixpath.join(dossier, empreinte[:2], empreinte[2:4], f"{empreinte}{extension}")
+
+    def _recevoir(self, content):
+        # Une seule lecture du contenu : l'empreinte est calculée pendant la
+        # copie vers un fichier temporaire du stockage, ou pendant la lecture
+        # d'un fichier déjà sur disque qui est ensuite déplacé sans recopie.
+        os.makedirs(self.location, exist_ok=True)
+        descripteur, chemin_temporaire = tempfile.mkstemp(dir=self.location, suffix='.tmp')
+        empreinte = hashlib.sha256()
+        try:
+            if hasattr(content, 'temporary_file_path'):
+                os.close(descripteur)
+                # Empreinte déjà calculée à la réception par
+                # GestionnaireFichierTemporaire : aucune lecture ici.
+                empreinte_connue = getattr(content, 'empreinte_sha256', None)
+                if empreinte_connue is None:
+                    with open(content.temporary_file_path(), 'rb') as source:
+                        for bloc in iter(lambda: source.read(TAILLE_BLOC_EMPREINTE), b''):
+                            empreinte.update(bloc)
+                file_move_safe(content.temporary_file_path(), chemin_temporaire, allow_overwrite=True)
+                if empreinte_connue is not None:
+                    return empreinte_connue, chemin_temporaire
+            else:
+                with os.fdopen(descripteur, 'wb') as destination:
+                    for bloc in content.chunks():
+                        if isinstance(bloc, str):
+                            bloc = bloc.encode()
+                        empreinte.update(bloc)
+                        destination.write(bloc)
+        except BaseException:
+            os.unlink(chemin_temporaire)
+            raise
+        return empreinte.hexdigest(), chemin_temporaire
+
+    def _save(self, name, content):
+        from .models import ReferenceMedia
+
+        empreinte, chemin_recu = self._recevoir(content)
+        name = self.nom_pour_empreinte(name, empreinte)
+        chemin = self.path(name)
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        os.chmod(chemin_recu, self.file_permissions_mode or 0o644)
+
+        # Compteur et fichier changent sous le même verrou d'écriture SQLite
+        # que delete() : un dernier retrait ne peut pas s'intercaler entre la
+        # vérification de présence et l'ajout de la référence. Le fichier
+        # reçu est déjà dans le stockage, le déplacement est un simple
+        # renommage.
+        with transaction.atomic():
+            reference, creee = ReferenceMedia.objects.get_or_create(nom=name, defaults={'taille': os.path.getsize(chemin_recu)})
+            if not creee:
+                ReferenceMedia.objects.filter(pk=reference.pk).update(references=models.F('references') + 1)
+            if os.path.exists(chemin):
+                os.unlink(chemin_recu)
+                # Contenu réutilisé : sa date repart de zéro pour que le délai
+                # de grâce de nettoyer_medias le protège jusqu'à ce que la
+                # ligne qui le référence soit enregistrée.
+                os.utime(chemin)
+            else:
+                os.replace(chemin_recu, chemin)
+        return name
+
+    def delete(self, name):
+        from .models import ReferenceMedia
+
+        if not name:
+            raise ValueError('The name must be given to delete().')
+
+        with transaction.atomic():
+            mis_a_jour = ReferenceMedia.objects.filter(nom=name, references__gt=1).update(references=models.F('references') - 1)
+            if mis_a_jour:
+                return
+            # Dernière référence, ou fichier antérieur au stockage par
+            # empreinte : on le retire pour de bon.
+            ReferenceMedia.objects.filter(nom=name).delete()
+            super().delete(name)
@@ -0,0 +1,116 @@
+import fcntl
+import hashlib
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from .models import TeleversementFragmente
+
+
+TAILLE_MAX_TELEVERSEMENT = 500 * 1024 * 1024
+TAILLE_MAX_FRAGMENT = 8 * 1024 * 1024
+TAILLE_BLOC_ECRITURE = 64 * 1024
+
+
+class ErreurTeleversement(Exception):
+    def __init__(self, message, statut=400):
+        super().__init__(message)
+        self.statut = statut
+
+
+class FichierAssemble(File):
+    # Expose le chemin sur disque comme un TemporaryUploadedFile :
+    # FileSystemStorage déplace alors le fichier au lieu de le recopier.
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def chemin_televersement(televersement):
+    return Path(settings.DOSSIER_TELEVERSEMENTS) / f"{televersement.identifiant.hex}.part"
+
+
+def creer_televersement(utilisateur, nom_fichier, taille):
+    if taille <= 0 or taille > TAILLE_MAX_TELEVERSEMENT:
+        raise ErreurTeleversement("Taille de fichier invalide.", statut=413 if taille > 0 else 400)
+
+    televersement = TeleversementFragmente.objects.create(
+        utilisateur=utilisateur,
+        nom_fichier=os.path.basename(nom_fichier)[:255] or 'video.mp4',
+        taille=taille,
+    )
+    chemin = chemin_televersement(televersement)
+    chemin.parent.mkdir(parents=True, exist_ok=True)
+    chemin.touch()
+    return televersement
+
+
+def ecrire_fragment(televersement, decalage, flux, longueur, somme_controle=''):
+    if longueur <= 0 or longueur > TAILLE_MAX_FRAGMENT:
+        raise ErreurTeleversement("Taille de fragment invalide.", statut=413 if longueur > 0 else 400)
+    if decalage + longueur > televersement.taille:
+        raise ErreurTeleversement("Le fragment dépasse la taille annoncée.")
+
+    with open(chemin_televersement(televersement), 'r+b') as fichier:
+        # Deux envois du même fragment (nouvel essai après une coupure) ne
+        # doivent jamais écrire en même temps.
+        fcntl.flock(fichier.fileno(), fcntl.LOCK_EX)
+        televersement.refresh_from_db(fields=['decalage'])
+        if decalage != televersement.decalage:
+            raise ErreurTeleversement("Décalage inattendu.", statut=409)
+
+        empreinte = hashlib.sha256()
+        fichier.seek(decalage)
+        restant = longueur
+        while restant > 0:
+            bloc = flux.read(min(restant, TAILLE_BLOC_ECRITURE))
+            if not bloc:
+                break
+            empreinte.update(bloc)
+            fichier.write(bloc)
+            restant -= len(bloc)
+
+        if restant or (somme_controle and empreinte.hexdigest() != somme_controle.lower()):
+            # Fragment incomplet ou corrompu : on l'efface pour que le client
+            # le renvoie au même décalage.
+            fichier.truncate(decalage)
+            raise ErreurTeleversement("Fragment incomplet." if restant else "Somme de contrôle invalide.", statut=422)
+
+        fichier.flush()
+        os.fsync(fichier.fileno())
+        TeleversementFragmente.objects.filter(pk=televersement.pk).update(
+            decalage=decalage + longueur,
+            date_modification=timezone.now(),
+        )
+    televersement.decalage = decalage + longueur
+    return televersement
+
+
+def fichier_assemble(televersement):
+    if not televersement.est_termine:
+        raise ErreurTeleversement("Le téléversement n'est pas terminé.", statut=409)
+    return FichierAssemble(open(chemin_televersement(televersement), 'rb'), name=televersement.nom_fichier)
+
+
+def abandonner_televersement(televersement):
+    try:
+        os.unlink(chemin_televersement(televersement))
+    except FileNotFoundError:
+        pass
+    televersement.delete()
+
+
+def restaurer_televersement(televersement, chemin):
+    # Remet en place le fichier assemblé déjà passé dans les médias, pour
+    # qu'une publication refusée puisse réutiliser le même téléversement. Un
+    # lien et non un déplacement : le média peut être partagé avec d'autres
+    # publications, c'est son retrait du stockage qui décide de sa suppression.
+    # Une vidéo réécrite avant le stockage a laissé le fichier assemblé en
+    # place : rien à restaurer.
+    try:
+        os.link(chemin, chemin_televersement(televersement))
+    except FileExistsError:
+        pass
@@ -0,0 +1,13 @@
+from django import template
+
+from immobilier.images import nom_miniature
+
+
+register = template.Library()
+
+
+@register.filter
+def miniature(fichier, taille):
+    if not fichier:
+        return ''
+    return fichier.storage.url(nom_miniature(fichier.name, int(taille)))
@@ -21,8 +21,15 @@ urlpatterns = [
     path('messages/nouveau/<int:identifiant_publication>/', vues.afficher_nouveau_message, name='nouveau_message'),
     path('messages/conversation/<int:identifiant_conversation>/', vues.afficher_messages_prives, name='messages_prives'),
 
+    path('media/<path:chemin>', vues.servir_media, name='servir_media'),
+
+    path('api/televersements/', vues.api_creer_televersement, name='api_creer_televersement'),
+    path('api/televersements/<uuid:identifiant>/', vues.api_televersement, name='api_televersement'),
+
     path('api/messages/conversations/', vues.api_liste_conversations, name='api_liste_conversations'),
+    path('api/messages/non_lus/', vues.api_nombre_non_lus, name='api_nombre_non_lus'),
     path('api/messages/conversation/<int:identifiant_conversation>/', vues.api_liste_messages, name='api_liste_messages'),
+    path('api/messages/conversation/<int:identifiant_conversation>/attendre/', vues.api_attendre_messages, name='api_attendre_messages'),
     path('api/messages/conversation/<int:identifiant_conversation>/envoyer/', vues.api_envoyer_message, name='api_envoyer_message'),
     path('api/messages/conversation/<int:identifiant_conversation>/marquer_lu/', vues.api_marquer_conversation_lue, name='api_marquer_conversation_lue'),
 ]
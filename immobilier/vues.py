@@ -1,20 +1,36 @@
+import logging
+import os
+import posixpath
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.db import models
+from django.core.exceptions import SuspiciousFileOperation
 from django.db import IntegrityError, transaction
-from django.http import JsonResponse
+from django.http import Http404, HttpResponseNotModified, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control
 from django.utils.http import url_has_allowed_host_and_scheme
-from django.views.decorators.http import require_http_methods
-
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+from django.views.decorators.http import etag, require_http_methods
+from PIL import Image
 
+from .cache_lectures import lieux_connus, profil_utilisateur, publication_details
 from .formulaires import FormulaireAdresse, FormulaireConnexion, FormulaireInscription, FormulaireMessage, FormulairePhotoProfil, FormulairePublicationBien, FormulaireSignalement
-from .models import Conversation, Message, Publication, Utilisateur
-from .services import generer_propositions_noms_utilisateur
+from .images import DOSSIER_MINIATURES, generer_miniature
+from .medias import reponse_fichier
+from .models import Conversation, Message, Publication, ResumeConversation, TeleversementFragmente
+from .notifications import attendre_message, dernier_message_connu
+from .pagination import paginer_par_curseur
+from .participants import est_participant, memoriser_participants, participants_conversation
+from .recherche import filtrer_par_texte
+from .serialisation import ResolveurUrls, accepte_msgpack, reponse_liste, reponse_serialisee, serialiser_message, serialiser_resume
+from .services import deposer_video, enregistrer_message, generer_propositions_noms_utilisateur, marquer_conversation_lue, recalculer_resumes_conversation, retirer_video, total_non_lus, version_conversations
+from .televersements import ErreurTeleversement, abandonner_televersement, creer_televersement, ecrire_fragment, restaurer_televersement
+
+
+journal = logging.getLogger(__name__)
 
 
 @require_http_methods(['GET'])
@@ -22,34 +38,76 @@ def afficher_index(request):
     return render(request, 'index.html')
 
 
-def _serialiser_message(message, utilisateur):
-    return {
-        'id': message.id,
-        'expediteur_id': message.expediteur_id,
-        'est_moi': message.expediteur_id == utilisateur.id,
-        'contenu': message.contenu,
-        'fichier_url': message.fichier.url if message.fichier else None,
-        'vocal_url': message.vocal.url if getattr(message, 'vocal', None) else None,
-        'type_message': getattr(message, 'type_message', 'TEXTE'),
-        'est_lu': getattr(message, 'est_lu', True),
-        'date_creation': message.date_creation.isoformat(),
-    }
+TAILLE_FENETRE_MESSAGES = 50
+TAILLE_MAX_MESSAGES = 200
+DELAI_REESSAI_ATTENTE = 3
 
 
-def _appliquer_tri_publications(publications, tri):
-    tri = (tri or '').strip()
-    if tri == 'prix_asc':
-        return publications.order_by('prix', '-date_creation'), tri
-    if tri == 'prix_desc':
-        return publications.order_by('-prix', '-date_creation'), tri
-    return publications.order_by('-date_creation'), 'recent'
+def _messages_conversation(conversation):
+    return Message.objects.filter(conversation=conversation)
 
 
-def _parametres_sans_page(request):
-    parametres = request.GET.copy()
-    if 'page' in parametres:
-        del parametres['page']
-    return parametres.urlencode()
+def _etat_lecture(identifiant_conversation, messages_liste):
+    # Contrairement aux participants, les indicateurs de lecture changent : la
+    # conversation n'est relue que s'il y a des messages à marquer.
+    if not messages_liste:
+        return None
+    return get_object_or_404(Conversation, pk=identifiant_conversation)
+
+
+def _refus_participant(request, identifiant_conversation):
+    # Depuis le cache des participants : 404 pour une conversation inconnue,
+    # 403 pour un tiers, None pour un participant.
+    participants = participants_conversation(identifiant_conversation)
+    if participants is None:
+        raise Http404
+    if request.user.id not in participants:
+        return JsonResponse({'detail': 'Interdit.'}, status=403)
+    return None
+
+
+def _reponse_messages(request, messages_liste, conversation, **supplements):
+    urls = ResolveurUrls()
+    return reponse_liste(
+        request,
+        'messages',
+        messages_liste,
+        lambda message: serialiser_message(message, request.user.id, conversation, urls),
+        **supplements,
+    )
+
+
+def _messages_avant(conversation, avant_id=None, taille=TAILLE_FENETRE_MESSAGES):
+    messages_qs = _messages_conversation(conversation)
+    if avant_id is not None:
+        messages_qs = messages_qs.filter(id__lt=avant_id)
+    return messages_qs.order_by('-id')[:taille + 1]
+
+
+def _fenetre_messages(conversation, avant_id=None, taille=TAILLE_FENETRE_MESSAGES):
+    messages_liste = list(_messages_avant(conversation, avant_id, taille))
+    a_plus_anciens = len(messages_liste) > taille
+    messages_liste = messages_liste[:taille]
+    messages_liste.reverse()
+    return messages_liste, a_plus_anciens
+
+
+ORDRES_TRI_PUBLICATIONS = {
+    'recent': ['-date_creation', '-id'],
+    'prix_asc': ['prix', '-date_creation', '-id'],
+    'prix_desc': ['-prix', '-date_creation', '-id'],
+}
+
+ORDRE_PERTINENCE = ['pertinence', '-id']
+
+
+def _ordre_publications(tri, avec_pertinence=False):
+    tri = (tri or '').strip()
+    if avec_pertinence and tri in ['', 'pertinence']:
+        return ORDRE_PERTINENCE, 'pertinence'
+    if tri not in ORDRES_TRI_PUBLICATIONS:
+        tri = 'recent'
+    return ORDRES_TRI_PUBLICATIONS[tri], tri
 
 
 def _parametres_sans_cles(request, cles):
@@ -60,14 +118,10 @@ def _parametres_sans_cles(request, cles):
     return parametres.urlencode()
 
 def afficher_feed(request):
-    tri = (request.GET.get('tri') or '').strip()
-    page = (request.GET.get('page') or '1').strip()
+    ordre, tri = _ordre_publications(request.GET.get('tri'))
 
     publications = Publication.objects.select_related('proprietaire', 'adresse')
-    publications, tri = _appliquer_tri_publications(publications, tri)
-
-    paginateur = Paginator(publications, 6)
-    page_objet = paginateur.get_page(page)
+    page_objet = paginer_par_curseur(publications, ordre, request.GET.get('curseur'), 6)
 
     return render(
         request,
@@ -76,61 +130,64 @@ def afficher_feed(request):
             'publications': page_objet.object_list,
             'page_objet': page_objet,
             'tri': tri,
-            'parametres_sans_page': _parametres_sans_page(request),
-            'parametres_sans_page_et_tri': _parametres_sans_cles(request, ['page', 'tri']),
+            'parametres_sans_curseur': _parametres_sans_cles(request, ['page', 'curseur']),
+            'parametres_sans_curseur_et_tri': _parametres_sans_cles(request, ['page', 'curseur', 'tri']),
         },
     )
 
 
 @require_http_methods(['GET'])
 def afficher_profil_utilisateur(request, nom_utilisateur):
-    utilisateur = get_object_or_404(Utilisateur, nom_utilisateur=nom_utilisateur)
-    publications = Publication.objects.filter(proprietaire=utilisateur).select_related('adresse').order_by('-date_creation')
+    profil = profil_utilisateur(nom_utilisateur)
+    if profil is None:
+        raise Http404
+    utilisateur, publications = profil
     return render(
         request,
         'profil_utilisateur.html',
         {
             'utilisateur': utilisateur,
             'publications': publications,
-            'nombre_publications': publications.count(),
+            'nombre_publications': len(publications),
         },
     )
 
 
-def afficher_recherche(request):
-    quartier = (request.GET.get('quartier') or '').strip()
-    commune = (request.GET.get('commune') or '').strip()
-    statut_transaction = (request.GET.get('statut_transaction') or '').strip()
-    disponibilite = (request.GET.get('disponibilite') or '').strip()
-
-    prix_min = (request.GET.get('prix_min') or '').strip()
-    prix_max = (request.GET.get('prix_max') or '').strip()
-    tri = (request.GET.get('tri') or '').strip()
-    page = (request.GET.get('page') or '1').strip()
-
-    publications = Publication.objects.select_related('proprietaire', 'adresse').order_by('-date_creation')
-
-    if quartier:
-        publications = publications.filter(adresse__quartier__icontains=quartier)
-    if commune:
-        publications = publications.filter(adresse__commune__icontains=commune)
-    if statut_transaction in [Publication.StatutTransaction.A_LOUER, Publication.StatutTransaction.A_VENDRE]:
-        publications = publications.filter(statut_transaction=statut_transaction)
-
-    if disponibilite == '1':
+def _filtrer_publications(publications, valeurs):
+    publications, avec_pertinence = filtrer_par_texte(
+        publications,
+        texte=valeurs['q'],
+        quartier=valeurs['quartier'],
+        commune=valeurs['commune'],
+    )
+
+    if valeurs['statut_transaction'] in [Publication.StatutTransaction.A_LOUER, Publication.StatutTransaction.A_VENDRE]:
+        publications = publications.filter(statut_transaction=valeurs['statut_transaction'])
+
+    if valeurs['disponibilite'] == '1':
         publications = publications.filter(est_disponible=True)
-    elif disponibilite == '0':
+    elif valeurs['disponibilite'] == '0':
         publications = publications.filter(est_disponible=False)
 
-    if prix_min.isdigit():
-        publications = publications.filter(prix__gte=int(prix_min))
-    if prix_max.isdigit():
-        publications = publications.filter(prix__lte=int(prix_max))
+    if valeurs['prix_min'].isdigit():
+        publications = publications.filter(prix__gte=int(valeurs['prix_min']))
+    if valeurs['prix_max'].isdigit():
+        publications = publications.filter(prix__lte=int(valeurs['prix_max']))
 
-    publications, tri = _appliquer_tri_publications(publications, tri)
+    return publications, avec_pertinence
 
-    paginateur = Paginator(publications, 10)
-    page_objet = paginateur.get_page(page)
+
+def afficher_recherche(request):
+    valeurs = {
+        cle: (request.GET.get(cle) or '').strip()
+        for cle in ['q', 'quartier', 'commune', 'statut_transaction', 'disponibilite', 'prix_min', 'prix_max']
+    }
+
+    publications, avec_pertinence = _filtrer_publications(Publication.objects.select_related('proprietaire', 'adresse'), valeurs)
+    ordre, tri = _ordre_publications(request.GET.get('tri'), avec_pertinence)
+    valeurs['tri'] = tri
+
+    page_objet = paginer_par_curseur(publications, ordre, request.GET.get('curseur'), 10)
 
     return render(
         request,
@@ -139,169 +196,319 @@ def afficher_recherche(request):
             'publications': page_objet.object_list,
             'page_objet': page_objet,
             'tri': tri,
-            'parametres_sans_page': _parametres_sans_page(request),
-            'valeurs': {
-                'quartier': quartier,
-                'commune': commune,
-                'prix_min': prix_min,
-                'prix_max': prix_max,
-                'statut_transaction': statut_transaction,
-                'disponibilite': disponibilite,
-                'tri': tri,
-            },
+            'parametres_sans_curseur': _parametres_sans_cles(request, ['page', 'curseur']),
+            'valeurs': valeurs,
+            'lieux': lieux_connus(),
         },
     )
 
 
+def _resumes_conversations(utilisateur):
+    return (
+        ResumeConversation.objects
+        .filter(utilisateur=utilisateur)
+        .select_related('conversation__publication', 'contact', 'dernier_message')
+        .order_by('-date_derniere_activite')
+    )
+
+
 @login_required
 @require_http_methods(['GET'])
 def api_liste_conversations(request):
-    conversations = (
-        Conversation.objects
-        .select_related('publication', 'proprietaire', 'demandeur')
-        .filter(models.Q(proprietaire=request.user) | models.Q(demandeur=request.user))
-        .order_by('-date_creation')
+    version, version_suppression = version_conversations(request.user.id)
+    resumes = _resumes_conversations(request.user)
+    complet = True
+
+    depuis = (request.GET.get('depuis') or '').strip()
+    if depuis.isdigit():
+        if int(depuis) >= version:
+            return HttpResponseNotModified()
+        if int(depuis) >= version_suppression:
+            resumes = resumes.filter(version__gt=int(depuis))
+            complet = False
+
+    urls = ResolveurUrls()
+    return reponse_liste(
+        request,
+        'conversations',
+        resumes,
+        lambda resume: serialiser_resume(resume, urls),
+        version=version,
+        complet=complet,
     )
-    identifiants = [c.id for c in conversations]
 
-    non_lus = (
-        Message.objects
-        .filter(conversation_id__in=identifiants, est_lu=False)
-        .exclude(expediteur=request.user)
-        .values('conversation_id')
-        .annotate(nombre=models.Count('id'))
-    )
-    non_lus_par_conversation = {n['conversation_id']: n['nombre'] for n in non_lus}
 
-    derniers = (
-        Message.objects
-        .filter(conversation_id__in=identifiants)
-        .values('conversation_id')
-        .annotate(dernier_id=models.Max('id'))
-    )
-    conversation_vers_dernier_id = {d['conversation_id']: d['dernier_id'] for d in derniers}
-    derniers_messages = Message.objects.filter(id__in=conversation_vers_dernier_id.values()).select_related('expediteur')
-    derniers_messages_par_conversation = {m.conversation_id: m for m in derniers_messages}
-
-    resultats = []
-    for c in conversations:
-        dernier = derniers_messages_par_conversation.get(c.id)
-        contact = c.demandeur if request.user.id == c.proprietaire_id else c.proprietaire
-        resultat = {
-            'conversation_id': c.id,
-            'publication_id': c.publication_id,
-            'contact_id': contact.id,
-            'contact_nom_utilisateur': contact.nom_utilisateur,
-            'contact_photo_url': contact.photo.url if contact.photo else None,
-            'dernier_message': _serialiser_message(dernier, request.user) if dernier else None,
-            'nombre_non_lus': non_lus_par_conversation.get(c.id, 0),
-        }
-        resultats.append(resultat)
-
-    return JsonResponse({'conversations': resultats})
+def _etag_non_lus(request):
+    request.nombre_non_lus = total_non_lus(request.user.id)
+    format_reponse = 'msgpack' if accepte_msgpack(request) else 'json'
+    return f"non-lus-{request.user.id}-{request.nombre_non_lus}-{format_reponse}"
+
+
+@login_required
+@require_http_methods(['GET'])
+@etag(_etag_non_lus)
+def api_nombre_non_lus(request):
+    reponse = reponse_serialisee(request, {'nombre_non_lus': request.nombre_non_lus})
+    patch_cache_control(reponse, private=True, no_cache=True)
+    return reponse
 
 
 @login_required
 @require_http_methods(['GET'])
 def api_liste_messages(request, identifiant_conversation):
-    conversation = get_object_or_404(
-        Conversation.objects.select_related('publication', 'proprietaire', 'demandeur'),
-        pk=identifiant_conversation,
-    )
-    if request.user.id not in [conversation.proprietaire_id, conversation.demandeur_id]:
-        return JsonResponse({'detail': 'Interdit.'}, status=403)
+    refus = _refus_participant(request, identifiant_conversation)
+    if refus:
+        return refus
+
+    limite = (request.GET.get('limite') or '').strip()
+    limite = min(int(limite), TAILLE_MAX_MESSAGES) if limite.isdigit() and int(limite) > 0 else TAILLE_MAX_MESSAGES
 
     depuis_id = (request.GET.get('depuis_id') or '').strip()
-    messages_qs = Message.objects.filter(conversation=conversation).select_related('expediteur')
-    if depuis_id.isdigit():
-        messages_qs = messages_qs.filter(id__gt=int(depuis_id))
+    avant_id = (request.GET.get('avant_id') or '').strip()
+    if avant_id.isdigit():
+        messages_liste, a_plus_anciens = _fenetre_messages(identifiant_conversation, int(avant_id), limite)
+    else:
+        messages_qs = _messages_conversation(identifiant_conversation)
+        if depuis_id.isdigit():
+            messages_qs = messages_qs.filter(id__gt=int(depuis_id))
+        messages_liste = list(messages_qs.order_by('id')[:limite])
+        a_plus_anciens = None
 
-    messages_liste = [_serialiser_message(m, request.user) for m in messages_qs.order_by('id')[:200]]
-    return JsonResponse({'messages': messages_liste})
+    supplements = {} if a_plus_anciens is None else {'a_plus_anciens': a_plus_anciens}
+    return _reponse_messages(request, messages_liste, _etat_lecture(identifiant_conversation, messages_liste), **supplements)
+
+
+@login_required
+@require_http_methods(['GET'])
+def api_attendre_messages(request, identifiant_conversation):
+    refus = _refus_participant(request, identifiant_conversation)
+    if refus:
+        return refus
+
+    depuis_id = (request.GET.get('depuis_id') or '').strip()
+    depuis_id = int(depuis_id) if depuis_id.isdigit() else 0
+
+    if dernier_message_connu(identifiant_conversation) <= depuis_id:
+        nouveau = attendre_message(identifiant_conversation, depuis_id)
+        if nouveau is None:
+            return reponse_serialisee(request, {'messages': [], 'delai_reessai': DELAI_REESSAI_ATTENTE})
+        if not nouveau:
+            return reponse_serialisee(request, {'messages': []})
+
+    messages_liste = list(
+        _messages_conversation(identifiant_conversation).filter(id__gt=depuis_id).order_by('id')[:TAILLE_MAX_MESSAGES]
+    )
+    return _reponse_messages(request, messages_liste, _etat_lecture(identifiant_conversation, messages_liste))
 
 
 @login_required
 @require_http_methods(['POST'])
 def api_envoyer_message(request, identifiant_conversation):
-    conversation = get_object_or_404(Conversation.objects.select_related('publication'), pk=identifiant_conversation)
-    if request.user.id not in [conversation.proprietaire_id, conversation.demandeur_id]:
-        return JsonResponse({'detail': 'Interdit.'}, status=403)
+    refus = _refus_participant(request, identifiant_conversation)
+    if refus:
+        return refus
+    conversation = get_object_or_404(Conversation, pk=identifiant_conversation)
 
     formulaire = FormulaireMessage(request.POST or None, request.FILES or None)
-    if not formulaire.is_valid():
-        return JsonResponse({'detail': 'Message invalide.'}, status=400)
+    if not _formulaire_valide(request, formulaire):
+        return JsonResponse({'detail': getattr(request, 'televersement_refuse', 'Message invalide.')}, status=400)
 
     message = formulaire.save(commit=False)
     message.conversation = conversation
     message.expediteur = request.user
-    message.est_lu = False
     message.full_clean()
-    message.save()
+    enregistrer_message(message)
 
-    message_json = _serialiser_message(message, request.user)
-
-    canal = get_channel_layer()
-    if canal is not None:
-        async_to_sync(canal.group_send)(
-            f"conversation_{conversation.id}",
-            {
-                'type': 'message_nouveau',
-                'message': message_json,
-            },
-        )
-
-    return JsonResponse({'message': message_json})
+    return reponse_serialisee(request, {'message': serialiser_message(message, request.user.id, conversation)})
 
 
 @login_required
 @require_http_methods(['POST'])
 def api_marquer_conversation_lue(request, identifiant_conversation):
+    refus = _refus_participant(request, identifiant_conversation)
+    if refus:
+        return refus
     conversation = get_object_or_404(Conversation, pk=identifiant_conversation)
-    if request.user.id not in [conversation.proprietaire_id, conversation.demandeur_id]:
-        return JsonResponse({'detail': 'Interdit.'}, status=403)
 
-    Message.objects.filter(conversation=conversation, est_lu=False).exclude(expediteur=request.user).update(est_lu=True)
+    marquer_conversation_lue(conversation, request.user)
     return JsonResponse({'ok': True})
 
 
+# Pièces jointes et vocaux ne sont servis qu'aux participants de leur
+# conversation ; le reste du dossier média est public.
+CHAMPS_MEDIAS_PRIVES = {
+    'fichiers_messages/': 'fichier',
+    'vocaux_messages/': 'vocal',
+}
+DOSSIERS_MEDIAS_PRIVES = tuple(CHAMPS_MEDIAS_PRIVES)
+
+
+def _media_autorise(request, chemin):
+    if not chemin.startswith(DOSSIERS_MEDIAS_PRIVES):
+        return True
+    if not request.user.is_authenticated:
+        return False
+    champ = CHAMPS_MEDIAS_PRIVES[chemin[:chemin.index('/') + 1]]
+    # Un même contenu envoyé dans plusieurs conversations n'est stocké
+    # qu'une fois : il suffit de participer à l'une d'elles.
+    conversations = (
+        Message.objects
+        .filter(**{champ: chemin})
+        .order_by()
+        .values_list('conversation_id', flat=True)
+        .distinct()
+    )
+    return any(est_participant(conversation_id, request.user.id) for conversation_id in conversations)
+
+
+@require_http_methods(['GET', 'HEAD'])
+def servir_media(request, chemin):
+    chemin = posixpath.normpath(chemin).lstrip('/')
+    try:
+        chemin_absolu = safe_join(settings.MEDIA_ROOT, chemin)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not _media_autorise(request, chemin):
+        raise Http404
+    if chemin.startswith(DOSSIER_MINIATURES) and not os.path.exists(chemin_absolu):
+        # Miniature demandée pour la première fois : générée puis gardée sur
+        # disque pour les requêtes suivantes.
+        try:
+            if generer_miniature(chemin) is None:
+                raise Http404
+        except (OSError, Image.DecompressionBombError):
+            raise Http404
+    try:
+        return reponse_fichier(request, chemin_absolu, prive=chemin.startswith(DOSSIERS_MEDIAS_PRIVES))
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        raise Http404
+
+
+def _formulaire_valide(request, formulaire):
+    # Un fichier refusé en cours de réception (controle_televersements)
+    # invalide tout le formulaire, même si les autres champs suffisent.
+    valide = formulaire.is_valid()
+    motif = getattr(request, 'televersement_refuse', None)
+    if motif:
+        if formulaire.is_bound:
+            formulaire.add_error(None, motif)
+        return False
+    return valide
+
+
+def _etat_televersement(televersement, status=200, **supplements):
+    return JsonResponse(
+        {
+            'identifiant': str(televersement.identifiant),
+            'decalage': televersement.decalage,
+            'taille': televersement.taille,
+            'termine': televersement.est_termine,
+            **supplements,
+        },
+        status=status,
+    )
+
+
+@login_required
+@require_http_methods(['POST'])
+def api_creer_televersement(request):
+    try:
+        taille = int(request.POST.get('taille', ''))
+    except ValueError:
+        return JsonResponse({'detail': 'Taille invalide.'}, status=400)
+
+    try:
+        televersement = creer_televersement(request.user, request.POST.get('nom_fichier', ''), taille)
+    except ErreurTeleversement as erreur:
+        return JsonResponse({'detail': str(erreur)}, status=erreur.statut)
+
+    return _etat_televersement(televersement, status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'PUT', 'DELETE'])
+def api_televersement(request, identifiant):
+    televersement = get_object_or_404(TeleversementFragmente, identifiant=identifiant, utilisateur=request.user)
+
+    if request.method == 'DELETE':
+        abandonner_televersement(televersement)
+        return JsonResponse({'ok': True})
+
+    if request.method == 'PUT':
+        try:
+            decalage = int(request.headers.get('X-Decalage', ''))
+            longueur = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return JsonResponse({'detail': 'Décalage invalide.'}, status=400)
+
+        try:
+            # Le corps est lu par blocs depuis le flux WSGI : jamais
+            # request.body, qui chargerait tout le fragment en mémoire.
+            ecrire_fragment(televersement, decalage, request, longueur, request.headers.get('X-Somme-Controle', ''))
+        except ErreurTeleversement as erreur:
+            return _etat_televersement(televersement, status=erreur.statut, detail=str(erreur))
+
+    return _etat_televersement(televersement)
+
+
 @login_required
 def afficher_publier_bien(request):
-    formulaire_publication = FormulairePublicationBien(request.POST or None, request.FILES or None)
+    formulaire_publication = FormulairePublicationBien(request.POST or None, request.FILES or None, utilisateur=request.user)
     formulaire_adresse = FormulaireAdresse(request.POST or None)
 
-    if request.method == 'POST' and formulaire_publication.is_valid() and formulaire_adresse.is_valid():
+    # L'unicité de l'adresse est vérifiée par is_valid(), une simple lecture,
+    # avant toute copie de la vidéo.
+    if request.method == 'POST' and _formulaire_valide(request, formulaire_publication) and formulaire_adresse.is_valid():
+        publication = formulaire_publication.save(commit=False)
+        publication.proprietaire = request.user
+        televersement = formulaire_publication.cleaned_data.get('televersement')
+
+        # Copie et réécriture de la vidéo hors transaction : le verrou
+        # d'écriture SQLite n'est tenu que le temps des deux INSERT.
+        deposer_video(publication)
+
         try:
             with transaction.atomic():
-                try:
-                    adresse = formulaire_adresse.save()
-                except IntegrityError:
-                    messages.error(request, "Cette adresse exacte existe déjà.")
-                    raise
-
-                publication = formulaire_publication.save(commit=False)
-                publication.proprietaire = request.user
-                publication.adresse = adresse
+                publication.adresse = formulaire_adresse.save()
                 publication.full_clean()
                 publication.save()
 
+        except Exception as erreur:
+            # Le fichier assemblé n'a pas été modifié (deposer_video ne réécrit
+            # qu'une copie) : il est rendu tel quel au client pour un nouvel
+            # essai. Un échec de ce rattrapage ne masque pas l'erreur d'origine.
+            try:
+                if televersement is not None:
+                    restaurer_televersement(televersement, publication.video.path)
+            except OSError:
+                journal.exception("Téléversement %s non restauré", televersement.identifiant)
+            finally:
+                retirer_video(publication)
+            if not isinstance(erreur, IntegrityError):
+                raise
+            # Même adresse publiée entre la vérification et l'INSERT.
+            messages.error(request, "Cette adresse exacte existe déjà.")
+
+        else:
+            if televersement is not None:
+                abandonner_televersement(televersement)
             return redirect('details_publication', identifiant=publication.id)
 
-        except IntegrityError:
-            if not any(m.level_tag == 'error' for m in messages.get_messages(request)):
-                messages.error(request, "Impossible de publier : doublon d'adresse.")
-
     return render(
         request,
         'publier_bien.html',
         {
             'formulaire_publication': formulaire_publication,
             'formulaire_adresse': formulaire_adresse,
+            'lieux': lieux_connus(),
         },
     )
 
 
 def afficher_details_publication(request, identifiant):
-    publication = get_object_or_404(Publication.objects.select_related('proprietaire', 'adresse'), pk=identifiant)
+    publication = publication_details(identifiant)
+    if publication is None:
+        raise Http404
     formulaire_signalement = FormulaireSignalement()
     return render(request, 'details_publication.html', {'publication': publication, 'formulaire_signalement': formulaire_signalement})
 
@@ -330,22 +537,8 @@ def afficher_profil(request):
     publications = Publication.objects.filter(proprietaire=request.user).select_related('adresse').order_by('-date_creation')
 
     nombre_publications = publications.count()
-    nombre_conversations = Conversation.objects.filter(
-        models.Q(proprietaire=request.user) | models.Q(demandeur=request.user)
-    ).count()
-    nombre_messages_non_lus = (
-        Message.objects
-        .filter(conversation__proprietaire=request.user)
-        .exclude(expediteur=request.user)
-        .filter(est_lu=False)
-        .count()
-        +
-        Message.objects
-        .filter(conversation__demandeur=request.user)
-        .exclude(expediteur=request.user)
-        .filter(est_lu=False)
-        .count()
-    )
+    nombre_conversations = ResumeConversation.objects.filter(utilisateur=request.user).count()
+    nombre_messages_non_lus = total_non_lus(request.user.id)
 
     return render(
         request,
@@ -370,14 +563,14 @@ def afficher_parametres(request):
 @require_http_methods(['POST'])
 def modifier_photo_profil(request):
     formulaire = FormulairePhotoProfil(request.POST or None, request.FILES or None)
-    if formulaire.is_valid():
+    if _formulaire_valide(request, formulaire):
         request.user.photo = formulaire.cleaned_data['photo']
         request.user.full_clean()
         request.user.save(update_fields=['photo'])
         messages.success(request, 'Photo de profil mise à jour.')
         return redirect('profil')
 
-    messages.error(request, 'Photo de profil invalide.')
+    messages.error(request, getattr(request, 'televersement_refuse', 'Photo de profil invalide.'))
     return redirect('parametres')
 
 
@@ -437,41 +630,15 @@ def afficher_liste_messages(request):
     if not identifiant_publication_source.isdigit():
         identifiant_publication_source = ''
 
-    conversations = (
-        Conversation.objects
-        .select_related('publication', 'proprietaire', 'demandeur')
-        .filter(models.Q(proprietaire=request.user) | models.Q(demandeur=request.user))
-        .order_by('-date_creation')
-    )
-
-    identifiants = [c.id for c in conversations]
-    derniers = (
-        Message.objects
-        .filter(conversation_id__in=identifiants)
-        .values('conversation_id')
-        .annotate(dernier_id=models.Max('id'))
-    )
-    conversation_vers_dernier_id = {d['conversation_id']: d['dernier_id'] for d in derniers}
-    derniers_messages = Message.objects.filter(id__in=conversation_vers_dernier_id.values()).select_related('expediteur')
-    derniers_messages_par_conversation = {m.conversation_id: m for m in derniers_messages}
-
-    non_lus = (
-        Message.objects
-        .filter(conversation_id__in=identifiants, est_lu=False)
-        .exclude(expediteur=request.user)
-        .values('conversation_id')
-        .annotate(nombre=models.Count('id'))
-    )
-    non_lus_par_conversation = {n['conversation_id']: n['nombre'] for n in non_lus}
-
+    version, _ = version_conversations(request.user.id)
     elements = []
-    for c in conversations:
-        dernier = derniers_messages_par_conversation.get(c.id)
+    for resume in _resumes_conversations(request.user):
         elements.append(
             {
-                'conversation': c,
-                'dernier_message': dernier,
-                'nombre_non_lus': non_lus_par_conversation.get(c.id, 0),
+                'conversation': resume.conversation,
+                'contact': resume.contact,
+                'dernier_message': resume.dernier_message,
+                'nombre_non_lus': resume.nombre_non_lus,
             }
         )
 
@@ -480,6 +647,7 @@ def afficher_liste_messages(request):
         'liste_messages.html',
         {
             'elements': elements,
+            'version_conversations': version,
             'identifiant_publication_source': identifiant_publication_source,
         },
     )
@@ -494,23 +662,24 @@ def afficher_nouveau_message(request, identifiant_publication):
         messages.error(request, "Tu ne peux pas t'écrire à toi-même.")
         return redirect('details_publication', identifiant=publication.id)
 
-    conversation, _ = Conversation.objects.get_or_create(
+    conversation, cree = Conversation.objects.get_or_create(
         publication=publication,
         proprietaire=publication.proprietaire,
         demandeur=request.user,
     )
+    if cree:
+        recalculer_resumes_conversation(conversation)
 
     if Message.objects.filter(conversation=conversation).exists():
         return redirect('messages_prives', identifiant_conversation=conversation.id)
 
     formulaire = FormulaireMessage(request.POST or None, request.FILES or None)
-    if request.method == 'POST' and formulaire.is_valid():
+    if request.method == 'POST' and _formulaire_valide(request, formulaire):
         message = formulaire.save(commit=False)
         message.conversation = conversation
         message.expediteur = request.user
-        message.est_lu = False
         message.full_clean()
-        message.save()
+        enregistrer_message(message)
         return redirect('messages_prives', identifiant_conversation=conversation.id)
 
     return render(
@@ -534,19 +703,19 @@ def afficher_messages_prives(request, identifiant_conversation):
 
     if request.user.id not in [conversation.proprietaire_id, conversation.demandeur_id]:
         return redirect('liste_messages')
+    memoriser_participants(conversation)
 
-    liste_messages = Message.objects.filter(conversation=conversation).select_related('expediteur')
+    liste_messages, a_plus_anciens = _fenetre_messages(conversation)
 
-    Message.objects.filter(conversation=conversation, est_lu=False).exclude(expediteur=request.user).update(est_lu=True)
+    marquer_conversation_lue(conversation, request.user)
 
     formulaire = FormulaireMessage(request.POST or None, request.FILES or None)
-    if request.method == 'POST' and formulaire.is_valid():
+    if request.method == 'POST' and _formulaire_valide(request, formulaire):
         message = formulaire.save(commit=False)
         message.conversation = conversation
         message.expediteur = request.user
-        message.est_lu = False
         message.full_clean()
-        message.save()
+        enregistrer_message(message)
         return redirect('messages_prives', identifiant_conversation=conversation.id)
 
     return render(
@@ -556,6 +725,7 @@ def afficher_messages_prives(request, identifiant_conversation):
             'conversation': conversation,
             'publication': conversation.publication,
             'messages': liste_messages,
+            'a_plus_anciens': a_plus_anciens,
             'formulaire': formulaire,
         },
     )